@@ -0,0 +1,218 @@
+from urllib.parse import urlparse
+
+import numpy as np
+import pandas as pd
+
+from emoji_usage import emoji_table, top_emojis
+
+MEDIA_TYPES = {'Images': 'image omitted', 'Videos': 'video omitted',
+               'Documents': 'document omitted', 'Audio': 'audio omitted'}
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+COUNT_COLUMNS = ['messages', 'words'] + list(MEDIA_TYPES) + ['links']
+
+_media_pattern = '|'.join(MEDIA_TYPES.values())
+
+
+def media_flags(message):
+    """
+    Flag which media placeholders each message contains.
+
+    Parameters:
+        message (pandas.Series): The message column.
+
+    Returns:
+        pandas.DataFrame: One 0/1 column per media type in ``MEDIA_TYPES``, aligned with ``message``.
+    """
+    flags = pd.DataFrame(0, index=message.index, columns=list(MEDIA_TYPES))
+    # Only the few media placeholders need the per-type checks.
+    media = message.str.contains(_media_pattern, regex=True).to_numpy()
+    for name, text in MEDIA_TYPES.items():
+        flags.loc[media, name] = message[media].str.contains(text, regex=False).astype(int)
+    return flags
+
+
+def build_link_table(df, offset=0):
+    """
+    Explode the links extracted at ingest into one row per shared link.
+
+    Parameters:
+        df (pandas.DataFrame): The DataFrame returned by ``preprocess``.
+        offset (int): Row number of ``df``'s first row within the whole chat.
+
+    Returns:
+        pandas.DataFrame: Columns ``row`` (message position), ``user``, ``date`` (day), ``url`` and
+        ``domain``.
+    """
+    has_links = (df['links'] != '').to_numpy()
+    shared = df[has_links]
+    urls = shared['links'].str.split(', ')
+    counts = urls.str.len().to_numpy()
+
+    links = pd.DataFrame({'row': np.repeat(np.flatnonzero(has_links) + offset, counts),
+                          'user': np.repeat(shared['user'].to_numpy(), counts),
+                          'date': np.repeat(shared['only_date'].to_numpy(), counts),
+                          'url': np.concatenate(urls.tolist()) if len(urls) else np.empty(0, dtype=object)})
+    domains = {url: urlparse(url).netloc or 'N/A' for url in links['url'].unique()}
+    links['domain'] = links['url'].map(domains)
+    return links
+
+
+def _plain_levels(table):
+    # Categorical index levels would not survive combining tables with different categories.
+    levels = [level.astype(level.categories.dtype) if isinstance(level, pd.CategoricalIndex) else level
+              for level in table.index.levels]
+    table.index = table.index.set_levels(levels)
+    return table
+
+
+class ChatAggregates:
+    """
+    Per-user count tables materialised from a parsed chat in one vectorized pass.
+
+    The tables answer the stats panels (message, word, media and link counts, the weekday x
+    period heatmap and the daily timeline) as lookups or small slices instead of scans of the
+    full frame. All counts are additive, so the tables of two parts of a chat can be combined
+    without going back to the messages. The link table from ``build_link_table`` is kept with the
+    counts so every link consumer reads the same extraction, and so are the emoji counts from
+    ``emoji_usage.emoji_table``.
+
+    Parameters:
+        per_user (pandas.DataFrame): Counts indexed by user.
+        heatmap (pandas.Series): Message counts indexed by (user, day_name, period).
+        daily (pandas.Series): Message counts indexed by (user, only_date).
+        links (pandas.DataFrame): One row per shared link, see ``build_link_table``.
+        emojis (pandas.Series): Emoji occurrences indexed by (user, emoji).
+    """
+
+    def __init__(self, per_user, heatmap, daily, links, emojis):
+        self.per_user = per_user
+        self.heatmap = heatmap
+        self.daily = daily
+        self.links = links
+        self.emojis = emojis
+
+    @classmethod
+    def from_frame(cls, df, offset=0, tokens=None):
+        """
+        Build the tables from a DataFrame returned by ``preprocess``.
+
+        Parameters:
+            df (pandas.DataFrame): The WhatsApp chat data.
+            offset (int): Row number of ``df``'s first row within the whole chat.
+            tokens (vocabulary.TokenIndex | None): Token index of ``df`` to take word counts from.
+
+        Returns:
+            ChatAggregates: The materialised tables.
+        """
+        message = df['message']
+        links = build_link_table(df, offset)
+        if tokens is not None:
+            words = tokens.row_words
+        else:
+            words = message.str.split().str.len().to_numpy()
+        counts = pd.DataFrame({'user': df['user'].to_numpy(),
+                               'messages': 1,
+                               'words': words,
+                               'links': np.bincount(links['row'] - offset, minlength=len(df))})
+
+        counts[list(MEDIA_TYPES)] = media_flags(message).to_numpy()
+
+        per_user = counts.groupby('user', sort=True)[COUNT_COLUMNS].sum()
+
+        heatmap = _plain_levels(df.groupby(['user', 'day_name', 'period'], observed=True).size())
+        daily = _plain_levels(df.groupby(['user', 'only_date'], observed=True).size())
+        return cls(per_user, heatmap, daily, links, emoji_table(df))
+
+    def combine(self, other, sign=1):
+        """
+        Add (or, with ``sign=-1``, remove) the counts of another part of the chat.
+
+        Parameters:
+            other (ChatAggregates): Tables of the rows being added or removed.
+            sign (int): 1 to add ``other``, -1 to subtract it.
+
+        Returns:
+            ChatAggregates: The combined tables.
+        """
+        per_user = self.per_user[COUNT_COLUMNS].add(sign * other.per_user[COUNT_COLUMNS], fill_value=0)
+        per_user = per_user[per_user['messages'] > 0].astype('int64')
+
+        heatmap = self.heatmap.add(sign * other.heatmap, fill_value=0).astype('int64').sort_index()
+        daily = self.daily.add(sign * other.daily, fill_value=0).astype('int64').sort_index()
+        emojis = self.emojis.add(sign * other.emojis, fill_value=0).astype('int64').sort_index()
+        if sign > 0:
+            links = pd.concat([self.links, other.links], ignore_index=True)
+        else:
+            links = self.links[~self.links['row'].isin(other.links['row'])]
+        return ChatAggregates(per_user, heatmap[heatmap > 0], daily[daily > 0], links, emojis[emojis > 0])
+
+    def tables(self):
+        """
+        Flat tables suitable for columnar storage.
+
+        Returns:
+            dict: Table name to DataFrame; ``from_tables`` restores the aggregates.
+        """
+        return {'per_user': self.per_user.reset_index(),
+                'heatmap': self.heatmap.rename('count').reset_index(),
+                'daily': self.daily.rename('count').reset_index(),
+                'links': self.links,
+                'emojis': self.emojis.rename('count').reset_index()}
+
+    @classmethod
+    def from_tables(cls, tables):
+        return cls(tables['per_user'].set_index('user'),
+                   tables['heatmap'].set_index(['user', 'day_name', 'period'])['count'].rename(None),
+                   tables['daily'].set_index(['user', 'only_date'])['count'].rename(None),
+                   tables['links'],
+                   tables['emojis'].set_index(['user', 'emoji'])['count'].rename(None))
+
+    def stats(self, selected_user):
+        row = self._user_counts(selected_user)
+        return int(row['messages']), int(row['words']), int(row['Images']), int(row['links'])
+
+    def busy_counts(self):
+        # Same order as value_counts() on the categorical user column: by count, ties by name.
+        return self.per_user['messages'].sort_values(ascending=False, kind='stable').rename('count')
+
+    def media(self, selected_user):
+        row = self._user_counts(selected_user)
+        return pd.DataFrame({'Media Type': list(MEDIA_TYPES),
+                             'Count': [int(row[name]) for name in MEDIA_TYPES]})
+
+    def daily_timeline(self, selected_user):
+        daily = self._user_slice(self.daily, selected_user)
+        daily = daily.groupby(level='only_date').sum()
+        return daily.rename('message').reset_index()
+
+    def week_activity(self, selected_user):
+        cells = self._user_slice(self.heatmap, selected_user)
+        week = cells.groupby(level='day_name').sum().rename('message')
+        return week.reindex(DAYS, fill_value=0)
+
+    def activity_heatmap(self, selected_user):
+        cells = self._user_slice(self.heatmap, selected_user)
+        return cells.groupby(level=['day_name', 'period']).sum().unstack('period', fill_value=0)
+
+    def top_emojis(self, selected_user, k=10):
+        counts = self._user_slice(self.emojis, selected_user)
+        return top_emojis(counts.groupby(level='emoji').sum(), k)
+
+    def emojis_per_message(self, selected_user):
+        messages = int(self._user_counts(selected_user)['messages'])
+        return int(self._user_slice(self.emojis, selected_user).sum()) / messages if messages else 0.0
+
+    def _user_counts(self, selected_user):
+        if selected_user == 'Overall':
+            return self.per_user[COUNT_COLUMNS].sum()
+        if selected_user not in self.per_user.index:
+            return pd.Series(0, index=COUNT_COLUMNS)
+        return self.per_user.loc[selected_user, COUNT_COLUMNS]
+
+    def _user_slice(self, table, selected_user):
+        if selected_user == 'Overall':
+            return table
+        try:
+            return table.xs(selected_user, level='user', drop_level=False)
+        except KeyError:
+            return table.iloc[:0]
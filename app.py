@@ -1,28 +1,64 @@
-import helper
 import streamlit as st
 import base64
-from preprocessor import preprocess
+import io
+import os
+from profiling import Profile, profiled, recording, stage
 
-import matplotlib.pyplot as plt
-import plotly.express as px
-import pandas as pd
-import seaborn as sns
-import numpy as np
+# pandas, matplotlib, seaborn, plotly and the parsing modules are imported by the functions that
+# need them, so the get started page renders without loading any of them.
 
 
 
+SECTION_CACHE_SIZE = 256
+PROGRESS_REFRESH_SECONDS = 0.5
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
+TIMELINE_TITLES = {'day': "Daily", 'week': "Weekly", 'month': "Monthly"}
+
 # Initialize session state
 if 'page' not in st.session_state:
     st.session_state.page = "get_started"
 
 
 def main():
-    if st.session_state.page == "get_started":
-        get_started_page()
-    elif st.session_state.page == "analysis":
-        analysis_page()
-
-
+    profile = performance_profile()
+    with recording(profile):
+        if st.session_state.page == "get_started":
+            get_started_page()
+        elif st.session_state.page == "analysis":
+            analysis_page()
+    performance_panel(profile)
+
+
+def performance_profile():
+    # The checkbox is drawn at the bottom of the sidebar; its state from the last run decides this one.
+    if not st.session_state.get('record_performance'):
+        return None
+    if 'profile' not in st.session_state:
+        st.session_state.profile = Profile()
+    st.session_state.profile.new_run()
+    return st.session_state.profile
+
+
+def performance_panel(profile):
+    with st.sidebar.expander("Performance"):
+        st.checkbox("Record stage timings", key='record_performance')
+        if profile is None:
+            return
+
+        import pandas as pd
+
+        stages = profile.frame(profile.run)
+        st.dataframe(pd.DataFrame({
+            'Stage': ['  ' * depth + name for depth, name in zip(stages['depth'], stages['stage'])],
+            'Seconds': stages['seconds'].round(4),
+            'Rows': stages['rows'],
+            'Memory (MiB)': (stages['memory_delta'] / 2 ** 20).round(1),
+        }))
+        st.download_button("Download JSON", profile.to_json(), file_name='performance.json',
+                           mime='application/json')
+
+
+@profiled('app.get_started_page')
 def get_started_page():
     st.title("Welcome to WhatsApp Chat Analyzer!")
 
@@ -45,35 +81,14 @@ def get_started_page():
 
 
 
-    # Example data for pie chart
-    labels_pie = ['A', 'B', 'C', 'D']
-    sizes_pie = [15, 30, 45, 10]
-    explode_pie = (0, 0.1, 0, 0)  # only "explode" the 2nd slice (i.e. 'B')
-    fig1, ax1 = plt.subplots()
-    ax1.pie(sizes_pie, explode=explode_pie, labels=labels_pie, autopct='%1.1f%%', startangle=90)
-    ax1.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
-
-    # Example data for bar graph
-    labels_bar = ['A', 'B', 'C', 'D']
-    values1_bar = [10, 20, 30, 40]
-    values2_bar = [5, 25, 35, 45]
-    x_bar = np.arange(len(labels_bar))
-    width_bar = 0.35  # the width of the bars
-    fig2, ax2 = plt.subplots()
-    rects1 = ax2.bar(x_bar - width_bar / 2, values1_bar, width_bar, label='Group 1')
-    rects2 = ax2.bar(x_bar + width_bar / 2, values2_bar, width_bar, label='Group 2')
-    ax2.set_xticks(x_bar)
-    ax2.set_xticklabels(labels_bar)
-    ax2.legend()
-
-    # Create columns to display the graphs side by side
+    # The example charts are pre-rendered by render_assets.py
     col1, col2 = st.columns(2)
 
     with col1:
-        st.pyplot(fig1)
+        st.image(os.path.join(ASSETS_DIR, 'demo_pie.png'), use_column_width=True)
 
     with col2:
-        st.pyplot(fig2)
+        st.image(os.path.join(ASSETS_DIR, 'demo_bar.png'), use_column_width=True)
 
 # Display steps for exporting chats on Android and iOS below the graphs
     st.markdown("## Exporting Chats Instructions")
@@ -102,68 +117,249 @@ def get_started_page():
             st.session_state.page = "analysis"
 
 
-@st.cache
+@st.cache_resource
+def get_parse_cache(db_path):
+    from parse_cache import ParseCache
+
+    return ParseCache(db_path)
+
+
+def parse_export(data, export_format=None):
+    from preprocessor import compact_frame, preprocess_parallel
+
+    # Calendar columns are derived on demand through df.calendar instead of being stored.
+    return compact_frame(preprocess_parallel(data, export_format=export_format))
+
+
+@st.cache_data(max_entries=2, show_spinner=False)
+def read_zip_upload(file_id, _upload):
+    from zip_export import read_export
+
+    return read_export(_upload)
+
+
 def preprocess_data(data, db_path):
-    processed_data = preprocess(data)
-    return processed_data
+    from sql_backend import SQL_MIN_BYTES, open_chat
+
+    # Chats too large to hold in memory are stored on disk and analyzed with SQL queries.
+    if len(data) >= SQL_MIN_BYTES:
+        return open_chat(data)
+
+    from background_parse import BACKGROUND_MIN_BYTES, parse_in_background
+
+    # The parse cache keeps the indexed chat and its aggregate tables in memory, so reruns reuse them.
+    cache = get_parse_cache(db_path)
+    if len(data) < BACKGROUND_MIN_BYTES:
+        return cache.get_chat(data, parse_export)
+
+    # Larger exports are parsed in the background; until they are done the page shows partial results.
+    chat = cache.get_cached(data, parse_export)
+    if chat is None:
+        job = parse_in_background(data, cache)
+        chat = job.result() if job.done else job
+    return chat
+
+
+@st.fragment(run_every=PROGRESS_REFRESH_SECONDS)
+def parse_progress(job):
+    from timeline import TimelineRollups
+
+    if job.done:
+        # The parsed chat is in the cache now; rerun the page to show the full analysis.
+        st.rerun()
+
+    progress = job.progress()
+    st.progress(progress['fraction'], text=f"Parsing the chat: {progress['rows']:,} messages so far")
+    aggregates = progress['aggregates']
+    if aggregates is None:
+        return
+
+    num_messages, words, num_media_messages, num_links = aggregates.stats('Overall')
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.markdown(f"**Total Messages:** {num_messages}")
+    with col2:
+        st.markdown(f"**Total Words:** {words}")
+    with col3:
+        st.markdown(f"**Media Shared:** {num_media_messages}")
+    with col4:
+        st.markdown(f"**Links Shared:** {num_links}")
+
+    st.subheader("Most Busy Users So Far")
+    st.bar_chart(aggregates.busy_counts().head())
+
+    rollups = TimelineRollups.from_frame(aggregates.daily_timeline('Overall'), 'only_date', 'message')
+    timeline, resolution = rollups.series()
+    st.subheader(f"{TIMELINE_TITLES[resolution]} Timeline So Far")
+    st.line_chart(timeline)
 
 
+@profiled('app.analysis_page')
 def analysis_page():
+    from background_parse import ParseJob
+    from preprocessor import memory_report
+    from sql_backend import SqlChat
+    from zip_export import is_zip
+
     st.sidebar.title("WhatsApp Chat Analyzer")
 
     uploaded_file = st.sidebar.file_uploader("Choose a file")
 
     if uploaded_file is not None:
-        bytes_data = uploaded_file.getvalue()
-        data = bytes_data.decode("utf-8")
+        media = None
+        with stage('app.read_upload') as record:
+            if is_zip(uploaded_file):
+                # "With media" exports: only the chat text is decompressed, media sizes come from the ZIP directory.
+                bytes_data, media = read_zip_upload(uploaded_file.file_id, uploaded_file)
+            else:
+                bytes_data = uploaded_file.getvalue()
+            record['rows'] = len(bytes_data)
+        st.session_state.media_inventory = media
         db_path = 'whatsapp_analysis.db'
-        df = preprocess_data(data, db_path)
+        with stage('app.preprocess_data') as record:
+            chat = preprocess_data(bytes_data, db_path)
+            if not isinstance(chat, ParseJob):
+                record['rows'] = len(chat)
+        if isinstance(chat, ParseJob):
+            parse_progress(chat)
+            return
+
+        with st.sidebar.expander("Memory"):
+            if isinstance(chat, SqlChat):
+                st.write(f"Stored on disk: {os.path.getsize(chat.path) / 2 ** 20:,.1f} MiB")
+            else:
+                st.dataframe(memory_report(chat.df))
 
         # fetch unique users
-        user_list = df['user'].unique().tolist()
-        user_list.sort()
+        user_list = list(chat.users)
         user_list.insert(0, "Overall")
 
         # Create a sidebar selectbox for user selection
         selected_user = st.sidebar.selectbox("Show analysis wrt", user_list)
 
-        # Fetch statistics for the selected user
-        num_messages, words, num_media_messages, num_links = helper.fetch_stats(selected_user, df)
-
-        col1, col2, col3, col4, col5 = st.columns(5)
-        with col1:
-            st.markdown(f"**Total Messages:** {num_messages}")
-        with col2:
-            st.markdown(f"**Total Words:** {words}")
-        with col3:
-            st.markdown(f"**Media Shared:** {num_media_messages}")
-        with col4:
-            st.markdown(f"**Links Shared:** {num_links}")
+        stats_section(selected_user, chat)
 
         if selected_user != "Overall":
-            user_specific_analysis(selected_user, df)  # Add this line to call the function for single user analysis
+            user_specific_analysis(selected_user, chat)  # Add this line to call the function for single user analysis
 
 
     # Additional Analysis: Busy Users (Pie Chart)
         st.title("Most Busy Users (Pie Chart)")
-        x, new_df = helper.most_busy_users(df)
-        fig, ax = plt.subplots(figsize=(8, 6))
-        ax.pie(x.values, labels=x.index, autopct='%1.1f%%', startangle=90)
-        ax.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
-        st.pyplot(fig)
+        x, new_df = section_data('most_busy_users', chat.key, 'Overall', chat)
+        st.image(section_chart('busy_users', chat.key, 'Overall', chat), use_column_width=True)
         st.dataframe(new_df)
 
-        # Add a sidebar dropdown menu to select another user for comparison
-        comparison_user = st.sidebar.selectbox("Compare with", user_list)
+        comparison_section(selected_user, user_list, chat)
+
+
+@st.fragment
+def stats_section(selected_user, chat):
+    import helper
+    import pandas as pd
+
+    # Moving the slider only reruns this fragment; each refresh is a few binary searches.
+    first, last = helper.date_bounds('Overall', chat)
+    start = end = None
+    if first is not None and first.date() < last.date():
+        start_day, end_day = st.slider("Date range", first.date(), last.date(), (first.date(), last.date()),
+                                       key=f'date_range_{chat.key}')
+        if (start_day, end_day) != (first.date(), last.date()):
+            start, end = pd.Timestamp(start_day), pd.Timestamp(end_day) + pd.Timedelta(days=1)
+
+    # Fetch statistics for the selected user
+    num_messages, words, num_media_messages, num_links = helper.fetch_stats(selected_user, chat, start, end)
+
+    col1, col2, col3, col4, col5 = st.columns(5)
+    with col1:
+        st.markdown(f"**Total Messages:** {num_messages}")
+    with col2:
+        st.markdown(f"**Total Words:** {words}")
+    with col3:
+        st.markdown(f"**Media Shared:** {num_media_messages}")
+    with col4:
+        st.markdown(f"**Links Shared:** {num_links}")
+
+
+@st.cache_data(max_entries=SECTION_CACHE_SIZE, show_spinner=False)
+def section_data(section, chat_key, selected_user, _chat, **options):
+    import helper
+
+    # Results are shared by every session showing the same chat; the chat itself is not hashed.
+    function = getattr(helper, section)
+    if section == 'most_busy_users':
+        return function(_chat)
+    return function(selected_user, _chat, **options)
+
+
+@st.cache_data(max_entries=SECTION_CACHE_SIZE, show_spinner=False)
+def section_chart(section, chat_key, selected_user, _chat):
+    import matplotlib.pyplot as plt
+
+    # Matplotlib charts are cached as the PNG that st.pyplot would have sent.
+    with stage(f'app.render.{section}'):
+        fig = CHARTS[section](selected_user, _chat)
+        image = io.BytesIO()
+        fig.savefig(image, format='png', dpi=200, bbox_inches='tight')
+        plt.close(fig)
+    return image.getvalue()
+
+
+def busy_users_chart(selected_user, chat):
+    import matplotlib.pyplot as plt
+
+    x, _ = section_data('most_busy_users', chat.key, selected_user, chat)
+    fig, ax = plt.subplots(figsize=(8, 6))
+    ax.pie(x.values, labels=x.index, autopct='%1.1f%%', startangle=90)
+    ax.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
+    return fig
+
+
+def week_activity_chart(selected_user, chat):
+    import matplotlib.pyplot as plt
+
+    busy_week = section_data('week_activity_map', chat.key, selected_user, chat)
+    days_order = ['Saturday', 'Friday', 'Thursday', 'Wednesday', 'Tuesday', 'Monday', 'Sunday']
+    busy_week = busy_week.reindex(days_order)
+    fig, ax = plt.subplots(figsize=(8, 6))
+    ax.barh(busy_week.index, busy_week.values, color='purple')
+    ax.set_xlabel('Number of Messages')
+    ax.set_ylabel('Day of Week')
+    ax.set_title(f"Weekly Activity Map for {selected_user}")
+    return fig
+
+
+def activity_heatmap_chart(selected_user, chat):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    activity_heatmap_data = section_data('activity_heatmap', chat.key, selected_user, chat)
+    fig, ax = plt.subplots(figsize=(10, 6))
+    sns.heatmap(activity_heatmap_data, cmap="Blues", cbar=True, ax=ax)
+    return fig
+
+
+CHARTS = {'busy_users': busy_users_chart,
+          'week_activity': week_activity_chart,
+          'activity_heatmap': activity_heatmap_chart}
+
 
-        if comparison_user != selected_user and comparison_user != "Overall":
-            compare_users(selected_user, comparison_user, df)
+@st.fragment
+def comparison_section(selected_user, user_list, chat):
+    # Picking another user only reruns this fragment, not the analysis above it.
+    comparison_user = st.selectbox("Compare with", user_list, key='comparison_user')
 
+    if comparison_user != selected_user and comparison_user != "Overall":
+        compare_users(selected_user, comparison_user, chat)
+
+
+@profiled('app.compare_users')
+def compare_users(user1, user2, chat):
+    import pandas as pd
+    import plotly.express as px
 
-def compare_users(user1, user2, df):
     # Fetch statistics for both users
-    stats_user1 = helper.fetch_stats(user1, df)
-    stats_user2 = helper.fetch_stats(user2, df)
+    stats_user1 = section_data('fetch_stats', chat.key, user1, chat)
+    stats_user2 = section_data('fetch_stats', chat.key, user2, chat)
 
     # Calculate number of links shared for each user
     num_links_user1 = stats_user1[3]
@@ -184,102 +380,196 @@ def compare_users(user1, user2, df):
                  barmode='group', title="Comparison of User Analysis")
     st.plotly_chart(fig)
 
-    # Display daily timeline for each user in bar graph format
-    st.title("Daily Timeline Comparison")
-    daily_timeline_user1 = helper.daily_timeline(user1, df)
-    daily_timeline_user2 = helper.daily_timeline(user2, df)
+    # Both timelines use the resolution that fits the whole chat, so their bars line up
+    resolution = chat.timeline('Overall').resolution_for()
+    title = TIMELINE_TITLES[resolution]
+
+    # Display the timeline for each user in bar graph format
+    st.title(f"{title} Timeline Comparison")
+    timeline_user1, _ = section_data('message_timeline', chat.key, user1, chat, resolution=resolution)
+    timeline_user2, _ = section_data('message_timeline', chat.key, user2, chat, resolution=resolution)
 
-    # Plot daily timeline for user 1
-    st.subheader(f"Daily Timeline for {user1}")
-    fig_user1 = px.bar(daily_timeline_user1, x='only_date', y='message', title=f'Daily Timeline for {user1}')
+    # Plot timeline for user 1
+    st.subheader(f"{title} Timeline for {user1}")
+    fig_user1 = px.bar(timeline_user1, x='date', y='message', title=f'{title} Timeline for {user1}')
     st.plotly_chart(fig_user1)
 
-    # Plot daily timeline for user 2
-    st.subheader(f"Daily Timeline for {user2}")
-    fig_user2 = px.bar(daily_timeline_user2, x='only_date', y='message', title=f'Daily Timeline for {user2}')
+    # Plot timeline for user 2
+    st.subheader(f"{title} Timeline for {user2}")
+    fig_user2 = px.bar(timeline_user2, x='date', y='message', title=f'{title} Timeline for {user2}')
     st.plotly_chart(fig_user2)
 
 
+@profiled('app.user_specific_analysis')
+def user_specific_analysis(selected_user, chat):
+    import helper
+    from conversations import DEFAULT_GAP_MINUTES
+    from sql_backend import SqlChat
 
-
-
-
-def user_specific_analysis(selected_user, df):
     st.title(f"Analysis for {selected_user}")
 
-    # Filter data for the selected user
-    user_df = df[df['user'] == selected_user]
-
     # Add first and last message with date
-    first_message_date = user_df['date'].min().strftime('%Y-%m-%d %H:%M:%S')
-    last_message_date = user_df['date'].max().strftime('%Y-%m-%d %H:%M:%S')
+    first_message, last_message = helper.date_bounds(selected_user, chat)
+    first_message_date = first_message.strftime('%Y-%m-%d %H:%M:%S')
+    last_message_date = last_message.strftime('%Y-%m-%d %H:%M:%S')
 
     st.write(f"First message date: {first_message_date}")
     st.write(f"Last message date: {last_message_date}")
 
-    # Additional analysis for week and month activity map
+    sections = USER_SECTIONS
+    if isinstance(chat, SqlChat):
+        # Chats stored on disk only support the sections backed by SQL queries.
+        sections = [section for section in USER_SECTIONS if section[0] in SQL_SECTIONS]
+        st.info("This chat is too large to load into memory; only the sections computed on disk are shown.")
+
+    if any(section[0] in CONVERSATION_SECTIONS for section in sections):
+        # Changing the gap reruns the whole page, so both conversation sections pick it up.
+        st.sidebar.slider("Conversation gap (minutes)", 5, 24 * 60, DEFAULT_GAP_MINUTES, step=5,
+                          key='conversation_gap',
+                          help="A conversation ends when nobody writes for longer than this.")
+
+    # Each section is computed and drawn only once it is switched on.
+    for name, label, render in sections:
+        lazy_section(name, label, render, selected_user, chat)
+
+
+@st.fragment
+def lazy_section(name, label, render, selected_user, chat):
+    # A fragment, so opening or closing one section does not rerun the others.
+    if st.toggle(label, key=f'section_{name}'):
+        render(selected_user, chat)
+
+
+def week_activity_section(selected_user, chat):
     st.title(f"Weekly Activity Map for {selected_user}")
-    busy_week = helper.week_activity_map(selected_user, df)
-    days_order = ['Saturday', 'Friday', 'Thursday', 'Wednesday', 'Tuesday', 'Monday', 'Sunday']
-    busy_week = busy_week.reindex(days_order)
-    fig, ax = plt.subplots(figsize=(8, 6))
-    ax.barh(busy_week.index, busy_week.values, color='purple')
-    ax.set_xlabel('Number of Messages')
-    ax.set_ylabel('Day of Week')
-    ax.set_title(f"Weekly Activity Map for {selected_user}")
-    st.pyplot(fig)
+    st.image(section_chart('week_activity', chat.key, selected_user, chat), use_column_width=True)
+
 
-    # Additional Analysis: Media Analysis
-    media_data = helper.media_analysis(selected_user, df)
+def media_section(selected_user, chat):
+    media_data = section_data('media_analysis', chat.key, selected_user, chat,
+                              media=st.session_state.get('media_inventory'))
     st.title(f"Media Analysis for {selected_user}")
     media_data.set_index('Media Type', inplace=True)
-    st.bar_chart(media_data)
+    if 'Bytes' in media_data:
+        # Exports with attached media also report the files and their sizes.
+        st.bar_chart(media_data[['Count', 'Files']])
+        media_data['Size (MiB)'] = (media_data.pop('Bytes') / 2 ** 20).round(1)
+        st.dataframe(media_data)
+    else:
+        st.bar_chart(media_data)
+
+
+def emoji_section(selected_user, chat):
+    top_emoji_data, emojis_per_message = section_data('emoji_analysis', chat.key, selected_user, chat)
+    st.title(f"Emoji Analysis for {selected_user}")
+    st.write(f"Emojis per message: {emojis_per_message:.2f}")
+    st.table(top_emoji_data)
+
 
-    # Additional Analysis: Message Length Analysis
-    message_length_data = helper.message_length_analysis(selected_user, df)
+def message_length_section(selected_user, chat):
+    message_length_data = section_data('message_length_analysis', chat.key, selected_user, chat)
     st.title(f"Message Length Analysis for {selected_user}")
     st.dataframe(message_length_data)
 
-    # Additional Analysis: Word Cloud
-    wordcloud_data = helper.create_wordcloud(selected_user, df)
+
+def wordcloud_section(selected_user, chat):
+    import helper
+
     st.title(f"Word Cloud for {selected_user}")
-    st.image(wordcloud_data.to_array(), use_column_width=True)
+    # The cloud is rendered off the script thread; until it is ready a placeholder polls for it.
+    future = helper.render_wordcloud(selected_user, chat)
+    if future.done():
+        st.image(future.result(), use_column_width=True)
+    else:
+        wordcloud_placeholder(future)
+
 
-    # Additional Analysis: Most Common Words
-    most_common_words_data = helper.most_common_words(selected_user, df)
+@st.fragment(run_every=PROGRESS_REFRESH_SECONDS)
+def wordcloud_placeholder(future):
+    if future.done():
+        # Rerun the page so the section draws the image without this polling fragment.
+        st.rerun()
+    st.info("Rendering the word cloud...")
+
+
+def common_words_section(selected_user, chat):
+    most_common_words_data = section_data('most_common_words', chat.key, selected_user, chat)
     st.title(f"Most Common Words for {selected_user}")
     st.table(most_common_words_data)
 
-    # Additional Analysis: Daily Timeline
-    daily_timeline_data = helper.daily_timeline(selected_user, df)
-    st.title(f"Daily Timeline for {selected_user}")
-    st.line_chart(daily_timeline_data.set_index('only_date'))
 
-    # Additional Analysis: Activity Heatmap
-    activity_heatmap_data = helper.activity_heatmap(selected_user, df)
+def daily_timeline_section(selected_user, chat):
+    # Long chats are shown per week or month so the chart stays small
+    timeline_data, resolution = section_data('message_timeline', chat.key, selected_user, chat)
+    st.title(f"{TIMELINE_TITLES[resolution]} Timeline for {selected_user}")
+    st.line_chart(timeline_data.set_index('date'))
+
+
+def activity_heatmap_section(selected_user, chat):
     st.title(f"Activity Heatmap for {selected_user}")
-    fig, ax = plt.subplots(figsize=(10, 6))
-    sns.heatmap(activity_heatmap_data, cmap="Blues", cbar=True, ax=ax)
-    st.pyplot(fig)
+    st.image(section_chart('activity_heatmap', chat.key, selected_user, chat), use_column_width=True)
 
-    # Additional Analysis: Link Analysis
-    unique_links_count, top_domains, link_activity_over_time = helper.link_analysis(df)
-    st.title("Link Analysis")
+
+def link_section(selected_user, chat):
+    import plotly.express as px
+    from timeline import bounded_timeline
+
+    unique_links_count, top_domains, link_activity_over_time = section_data('link_analysis', chat.key,
+                                                                            selected_user, chat)
+    st.title(f"Link Analysis for {selected_user}")
     st.write(f"Unique Links Count: {unique_links_count}")
     st.write("Top Shared Domains:")
     st.table(top_domains)
 
     # Bar chart for link activity over time
-    st.write("Link Activity Over Time:")
+    link_activity_over_time, resolution = bounded_timeline(link_activity_over_time, 'Date', 'Link_Activity')
+    st.write(f"Link Activity Over Time ({TIMELINE_TITLES[resolution].lower()}):")
     fig = px.bar(link_activity_over_time, x='Date', y='Link_Activity', title='Link Activity Over Time')
     st.plotly_chart(fig)
 
-    # Additional Analysis: Popular Content Analysis
-    top_content = helper.popular_content_analysis(df)
-    st.title("Popular Content Analysis")
+
+def popular_content_section(selected_user, chat):
+    top_content = section_data('popular_content_analysis', chat.key, selected_user, chat)
+    st.title(f"Popular Content Analysis for {selected_user}")
     st.table(top_content)
 
 
+def conversation_section(selected_user, chat):
+    gap_minutes = st.session_state.conversation_gap
+    num_conversations, started, median_messages, initiators = section_data(
+        'conversation_analysis', chat.key, selected_user, chat, gap_minutes=gap_minutes)
+    st.title(f"Conversations of {selected_user}")
+    st.write(f"Conversations: {num_conversations} (split after {gap_minutes} idle minutes)")
+    st.write(f"Started by {selected_user}: {started}")
+    st.write(f"Median messages per conversation: {median_messages:g}")
+    st.write("Who starts conversations:")
+    st.dataframe(initiators, hide_index=True)
+
+
+def reply_time_section(selected_user, chat):
+    latency_matrix, response_times = section_data('reply_time_analysis', chat.key, selected_user, chat,
+                                                  gap_minutes=st.session_state.conversation_gap)
+    st.title(f"Reply Times for {selected_user}")
+    st.write("Median response time (minutes):")
+    st.dataframe(response_times, hide_index=True)
+    st.write("Median reply latency in minutes (rows reply to columns):")
+    st.dataframe(latency_matrix.round(1))
+
+
+USER_SECTIONS = [('week_activity', "Weekly Activity Map", week_activity_section),
+                 ('media', "Media Analysis", media_section),
+                 ('message_length', "Message Length Analysis", message_length_section),
+                 ('emojis', "Emoji Analysis", emoji_section),
+                 ('wordcloud', "Word Cloud", wordcloud_section),
+                 ('common_words', "Most Common Words", common_words_section),
+                 ('daily_timeline', "Message Timeline", daily_timeline_section),
+                 ('activity_heatmap', "Activity Heatmap", activity_heatmap_section),
+                 ('links', "Link Analysis", link_section),
+                 ('popular_content', "Popular Content Analysis", popular_content_section),
+                 ('conversations', "Conversations", conversation_section),
+                 ('reply_times', "Reply Times", reply_time_section)]
+SQL_SECTIONS = {'week_activity', 'media', 'daily_timeline', 'activity_heatmap'}
+CONVERSATION_SECTIONS = {'conversations', 'reply_times'}
 
 
 if __name__ == "__main__":
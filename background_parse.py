@@ -0,0 +1,143 @@
+import contextvars
+import threading
+
+from aggregates import ChatAggregates
+from chat_index import ChatIndex
+from parse_cache import content_hash
+from preprocessor import compact_frame, concat_frames, preprocess_shards, preprocess_stream
+from profiling import stage
+
+# Exports at least this large are parsed in the background while the page shows partial results.
+BACKGROUND_MIN_BYTES = 8 * 1024 * 1024
+# Small enough that the first shard is published within about a second, while every core stays busy.
+PROGRESS_SHARD_BYTES = 2 * 1024 * 1024
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+class ParseJob:
+    """
+    Parse an export in the background, publishing running aggregates after every shard.
+
+    The shards are parsed in a process pool by ``preprocess_shards``; a background thread collects
+    them in chat order and adds each shard's ``ChatAggregates`` to the running totals, so the
+    message counts, busiest users and timeline of the part parsed so far are available while
+    parsing goes on. When the last shard is in, the shards form the final ``ChatIndex`` (with the
+    aggregates already built), which is stored in the parse cache if one is given.
+
+    Parameters:
+        data (bytes): The raw export.
+        key (str): Content hash of ``data``.
+        parse_cache (parse_cache.ParseCache | None): Cache receiving the finished chat.
+        shard_bytes (int): Approximate size of the part of the export parsed between two updates.
+    """
+
+    def __init__(self, data, key, parse_cache=None, shard_bytes=PROGRESS_SHARD_BYTES):
+        self.key = key
+        self.size = len(data)
+        self.chat = None
+        self.error = None
+        self._lock = threading.Lock()
+        self._progress = {'bytes': 0, 'rows': 0, 'aggregates': None}
+        self._done = threading.Event()
+        # Stages are recorded in the profile of the run that started the job.
+        self._thread = threading.Thread(target=contextvars.copy_context().run,
+                                        args=(self._run, data, parse_cache, shard_bytes),
+                                        name=f'parse-{key[:8]}', daemon=True)
+        self._thread.start()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def progress(self):
+        """
+        Snapshot of the work done so far.
+
+        Returns:
+            dict: ``fraction`` of the export parsed, ``rows`` parsed and the running ``aggregates``
+            (``ChatAggregates``, None before the first chunk).
+        """
+        with self._lock:
+            progress = dict(self._progress)
+        parsed = progress.pop('bytes')
+        if self.done:
+            progress['fraction'] = 1.0
+        else:
+            progress['fraction'] = min(parsed / self.size, 1.0) if self.size else 0.0
+        return progress
+
+    def result(self, timeout=None):
+        """
+        Wait for the parse to finish.
+
+        Parameters:
+            timeout (float | None): Seconds to wait; forever if None.
+
+        Returns:
+            ChatIndex: The parsed chat.
+
+        Raises:
+            TimeoutError: If the parse is still running after ``timeout`` seconds.
+            Exception: Whatever the parser raised.
+        """
+        if not self._done.wait(timeout):
+            raise TimeoutError(f'Parsing {self.key} is still running.')
+        if self.error is not None:
+            raise self.error
+        return self.chat
+
+    def _run(self, data, parse_cache, shard_bytes):
+        try:
+            self.chat = self._parse(data, shard_bytes)
+            if parse_cache is not None:
+                with stage('cache.put', rows=len(self.chat)):
+                    parse_cache.put(self.chat, data)
+        except Exception as e:
+            self.error = e
+        else:
+            # The chat is reachable through the cache now; a failed job stays to report its error.
+            with _jobs_lock:
+                if _jobs.get(self.key) is self:
+                    del _jobs[self.key]
+        finally:
+            self._done.set()
+
+    def _parse(self, data, shard_bytes):
+        frames, aggregates, rows = [], None, 0
+        for end, frame in preprocess_shards(data, shard_bytes):
+            frame = compact_frame(frame)
+            part = ChatAggregates.from_frame(frame, offset=rows)
+            aggregates = part if aggregates is None else aggregates.combine(part)
+            frames.append(frame)
+            rows += len(frame)
+            with self._lock:
+                self._progress = {'bytes': end, 'rows': rows, 'aggregates': aggregates}
+
+        if not frames:
+            return ChatIndex(compact_frame(preprocess_stream(data)), self.key)
+        return ChatIndex(concat_frames(frames), self.key, aggregates)
+
+
+def parse_in_background(data, parse_cache=None, shard_bytes=PROGRESS_SHARD_BYTES):
+    """
+    Start parsing an export in the background, or return the job already parsing it.
+
+    Parameters:
+        data (bytes): The raw export.
+        parse_cache (parse_cache.ParseCache | None): Cache receiving the finished chat.
+        shard_bytes (int): Approximate size of the part of the export parsed between two updates.
+
+    Returns:
+        ParseJob: The job. A failed job is returned once more to report its error, then forgotten so
+        the parse can be retried.
+    """
+    key = content_hash(data)
+    with _jobs_lock:
+        job = _jobs.get(key)
+        if job is None:
+            job = _jobs[key] = ParseJob(data, key, parse_cache, shard_bytes)
+        elif job.done:
+            del _jobs[key]
+    return job
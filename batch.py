@@ -0,0 +1,300 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import seaborn as sns
+
+import helper
+from chat_index import ChatIndex
+from parse_cache import content_hash
+from preprocessor import SCHEMA_VERSION, preprocess_stream
+from zip_export import is_zip, read_export
+
+MANIFEST = 'manifest.json'
+EXPORT_PATTERNS = ('*.txt', '*.zip')
+
+
+def find_exports(inputs):
+    """
+    Expand directories and glob patterns into export files.
+
+    Every export is named after its path relative to the directory it was found in (the part of a
+    glob pattern before the first wildcard), so the same export keeps the same output directory
+    from run to run. Exports that would share a name also get a hash of their path.
+
+    Parameters:
+        inputs (list): Directories (searched recursively for ``*.txt`` and ``*.zip``), files or glob
+            patterns.
+
+    Returns:
+        dict: Export path to output name, sorted by path.
+    """
+    exports = {}
+    for item in inputs:
+        if os.path.isdir(item):
+            base = item
+            paths = [path for pattern in EXPORT_PATTERNS
+                     for path in glob.glob(os.path.join(item, '**', pattern), recursive=True)]
+        else:
+            base = _glob_base(item)
+            paths = [path for path in glob.glob(item, recursive=True) if os.path.isfile(path)]
+        for path in paths:
+            exports.setdefault(path, os.path.splitext(os.path.relpath(path, base))[0])
+
+    # Exports found under different inputs can share a relative name; their path tells them apart.
+    taken = {}
+    for path, name in sorted(exports.items()):
+        if name in taken:
+            digest = hashlib.blake2b(os.path.abspath(path).encode('utf-8'), digest_size=4).hexdigest()
+            exports[path] = f'{name}-{digest}'
+        taken[name] = path
+    return dict(sorted(exports.items()))
+
+
+def _glob_base(pattern):
+    parts = []
+    for part in os.path.normpath(pattern).split(os.sep)[:-1]:
+        if any(char in part for char in '*?['):
+            break
+        parts.append(part)
+    return os.sep.join(parts) or os.curdir
+
+
+def _source_state(path):
+    status = os.stat(path)
+    return {'source': os.path.abspath(path), 'size': status.st_size, 'mtime_ns': status.st_mtime_ns}
+
+
+def _read_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _outputs_present(manifest, out_dir):
+    return all(os.path.exists(os.path.join(out_dir, name)) for name in manifest['outputs'])
+
+
+def is_up_to_date(path, out_dir, charts=False):
+    """
+    Tell whether the outputs of an export are current, judging by file size and modification time.
+
+    Parameters:
+        path (str): Export file.
+        out_dir (str): Output directory of the export.
+        charts (bool): Whether chart images are requested.
+
+    Returns:
+        bool: True when the outputs were written from this file, by this schema version and with
+        charts if requested.
+    """
+    manifest = _read_manifest(out_dir)
+    if manifest is None or manifest.get('schema_version') != SCHEMA_VERSION:
+        return False
+    if charts and not manifest.get('charts'):
+        return False
+    state = _source_state(path)
+    return all(manifest.get(name) == value for name, value in state.items()) and _outputs_present(manifest, out_dir)
+
+
+def analyze_chat(path, out_dir, charts=False):
+    """
+    Parse one export and write its analysis.
+
+    Outputs are written first and the manifest last, so an interrupted run leaves the chat out of
+    date rather than half written. A chat whose file was touched but whose content did not change
+    only gets its manifest refreshed.
+
+    Parameters:
+        path (str): Export file: the chat text, or a "with media" ZIP archive.
+        out_dir (str): Output directory of the export.
+        charts (bool): Whether to also render PNG charts.
+
+    Returns:
+        dict: ``path``, ``status`` ('written' or 'unchanged'), ``messages`` and ``seconds``.
+    """
+    start = time.perf_counter()
+    media = None
+    if is_zip(path):
+        data, media = read_export(path)
+    else:
+        with open(path, 'rb') as f:
+            data = f.read()
+    key = content_hash(data)
+    if media is not None:
+        # The attachments are part of the analysis, so a re-export with other files is a change.
+        key = content_hash(data + media.to_csv(index=False).encode('utf-8'))
+
+    manifest = _read_manifest(out_dir)
+    if (manifest is not None and manifest.get('content_hash') == key
+            and manifest.get('schema_version') == SCHEMA_VERSION and (manifest.get('charts') or not charts)
+            and _outputs_present(manifest, out_dir)):
+        manifest.update(_source_state(path))
+        _write_json(os.path.join(out_dir, MANIFEST), manifest)
+        return {'path': path, 'status': 'unchanged', 'messages': manifest['messages'],
+                'seconds': time.perf_counter() - start}
+
+    chat = ChatIndex(preprocess_stream(data), key)
+    os.makedirs(out_dir, exist_ok=True)
+    outputs = _write_tables(chat, out_dir, media)
+    if charts:
+        outputs += _write_charts(chat, out_dir)
+
+    manifest = {**_source_state(path), 'content_hash': key, 'schema_version': SCHEMA_VERSION,
+                'charts': charts, 'messages': len(chat), 'outputs': outputs}
+    _write_json(os.path.join(out_dir, MANIFEST), manifest)
+    return {'path': path, 'status': 'written', 'messages': len(chat), 'seconds': time.perf_counter() - start}
+
+
+def _write_tables(chat, out_dir, media=None):
+    users = ['Overall'] + chat.users
+
+    stats = {}
+    for user in users:
+        num_messages, words, num_media_messages, num_links = helper.fetch_stats(user, chat)
+        media_types = helper.media_analysis(user, chat, media)
+        stats[user] = {'messages': num_messages, 'words': words, 'media': num_media_messages, 'links': num_links,
+                       'media_types': dict(zip(media_types['Media Type'], media_types['Count'].astype(int).tolist()))}
+        if media is not None:
+            stats[user]['attachments'] = {row['Media Type']: {'files': int(row['Files']), 'bytes': int(row['Bytes'])}
+                                          for _, row in media_types.iterrows()}
+    _, busy = helper.most_busy_users(chat)
+    unique_links_count, top_domains, _ = helper.link_analysis('Overall', chat)
+    dates = chat.df['date']
+    _write_json(os.path.join(out_dir, 'stats.json'), {
+        'messages': len(chat),
+        'first_message': None if dates.empty else dates.min().isoformat(),
+        'last_message': None if dates.empty else dates.max().isoformat(),
+        'unique_links': int(unique_links_count),
+        'users': stats,
+        'busy_users': busy.to_dict(orient='records'),
+    })
+
+    helper.daily_timeline('Overall', chat).to_parquet(os.path.join(out_dir, 'daily_timeline.parquet'), index=False)
+    chat.aggregates.daily.rename('message').reset_index().to_parquet(
+        os.path.join(out_dir, 'user_daily_timeline.parquet'), index=False)
+
+    top_words = {user: helper.most_common_words(user, chat).values.tolist() for user in users}
+    _write_json(os.path.join(out_dir, 'top_words.json'), top_words)
+
+    top_content = helper.popular_content_analysis('Overall', chat)
+    _write_json(os.path.join(out_dir, 'top_domains.json'), {
+        'domains': top_domains.values.tolist(),
+        'content': top_content.values.tolist(),
+    })
+    return ['stats.json', 'daily_timeline.parquet', 'user_daily_timeline.parquet', 'top_words.json',
+            'top_domains.json']
+
+
+def _write_charts(chat, out_dir):
+    timeline = helper.daily_timeline('Overall', chat)
+    fig, ax = plt.subplots(figsize=(12, 4))
+    ax.plot(timeline['only_date'], timeline['message'])
+    ax.set_title('Daily Timeline')
+    fig.savefig(os.path.join(out_dir, 'daily_timeline.png'), bbox_inches='tight')
+    plt.close(fig)
+
+    x, _ = helper.most_busy_users(chat)
+    fig, ax = plt.subplots(figsize=(8, 6))
+    ax.pie(x.values, labels=x.index, autopct='%1.1f%%', startangle=90)
+    ax.axis('equal')
+    fig.savefig(os.path.join(out_dir, 'busy_users.png'), bbox_inches='tight')
+    plt.close(fig)
+
+    fig, ax = plt.subplots(figsize=(10, 6))
+    sns.heatmap(helper.activity_heatmap('Overall', chat), cmap='Blues', cbar=True, ax=ax)
+    fig.savefig(os.path.join(out_dir, 'activity_heatmap.png'), bbox_inches='tight')
+    plt.close(fig)
+
+    helper.create_wordcloud('Overall', chat).to_file(os.path.join(out_dir, 'wordcloud.png'))
+    return ['daily_timeline.png', 'busy_users.png', 'activity_heatmap.png', 'wordcloud.png']
+
+
+def _write_json(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False, default=str)
+
+
+def run_batch(exports, output_dir, workers=None, charts=False, force=False, log=print):
+    """
+    Analyze many exports in a process pool.
+
+    Parameters:
+        exports (dict): Export path to output name, as returned by ``find_exports``.
+        output_dir (str): Directory receiving one sub-directory per export.
+        workers (int | None): Number of worker processes; None uses ``os.cpu_count()``.
+        charts (bool): Whether to also render PNG charts.
+        force (bool): Re-analyze exports whose outputs are up to date.
+        log (callable): Receives one line per finished export.
+
+    Returns:
+        dict: Counts of ``written``, ``unchanged``, ``skipped`` and ``failed`` chats, ``messages``
+        parsed, ``seconds`` elapsed, and the ``chats_per_second`` and ``messages_per_second`` rates.
+    """
+    start = time.perf_counter()
+    summary = {'written': 0, 'unchanged': 0, 'skipped': 0, 'failed': 0, 'messages': 0}
+
+    pending = []
+    for path, name in exports.items():
+        out_dir = os.path.join(output_dir, name)
+        if not force and is_up_to_date(path, out_dir, charts):
+            summary['skipped'] += 1
+        else:
+            pending.append((path, out_dir))
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(analyze_chat, path, out_dir, charts): path for path, out_dir in pending}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    summary['failed'] += 1
+                    log(f'FAILED {futures[future]}: {type(e).__name__}: {e}')
+                    continue
+                summary[result['status']] += 1
+                if result['status'] == 'written':
+                    summary['messages'] += result['messages']
+                log(f"{result['status']:<9} {result['path']} ({result['messages']:,} messages, "
+                    f"{result['seconds']:.2f} s)")
+
+    summary['seconds'] = time.perf_counter() - start
+    processed = summary['written']
+    summary['chats_per_second'] = processed / summary['seconds'] if summary['seconds'] else 0.0
+    summary['messages_per_second'] = summary['messages'] / summary['seconds'] if summary['seconds'] else 0.0
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Analyze WhatsApp chat exports without the web app.')
+    parser.add_argument('inputs', nargs='+', help='export files, directories or glob patterns')
+    parser.add_argument('-o', '--output-dir', default='analysis', help='where to write the results')
+    parser.add_argument('-j', '--workers', type=int, help='worker processes (default: one per core)')
+    parser.add_argument('--charts', action='store_true', help='also render PNG charts')
+    parser.add_argument('--force', action='store_true', help='re-analyze chats whose outputs are up to date')
+    args = parser.parse_args(argv)
+
+    exports = find_exports(args.inputs)
+    if not exports:
+        print('No exports found.', file=sys.stderr)
+        return 1
+
+    summary = run_batch(exports, args.output_dir, args.workers, args.charts, args.force)
+    print(f"{summary['written']} written, {summary['unchanged']} unchanged, {summary['skipped']} skipped, "
+          f"{summary['failed']} failed in {summary['seconds']:.1f} s "
+          f"({summary['chats_per_second']:.2f} chats/s, {summary['messages_per_second']:,.0f} messages/s)")
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
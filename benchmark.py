@@ -0,0 +1,300 @@
+import argparse
+import gc
+import inspect
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import helper
+from chat_index import ChatIndex
+from preprocessor import preprocess, preprocess_parallel
+from synthetic import generate_chat, write_chat
+
+SIZES = [10_000, 100_000, 1_000_000, 5_000_000]
+DEFAULT_THRESHOLD = 0.25
+# Differences below these are noise, whatever the ratio.
+MIN_SECONDS = 0.01
+MIN_BYTES = 1024 * 1024
+
+# render_wordcloud only schedules create_wordcloud on a thread and caches the result.
+SKIPPED_HELPERS = {'render_wordcloud'}
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Each startup case runs in a fresh interpreter: (name, untimed setup, timed statement).
+STARTUP_CASES = [
+    ('startup.import_app', '', 'import app'),
+    ('startup.import_helper', '', 'import helper'),
+    ('startup.import_preprocessor', '', 'import preprocessor'),
+    ('startup.first_render', 'from streamlit.testing.v1 import AppTest',
+     f"AppTest.from_file({os.path.join(ROOT, 'app.py')!r}, default_timeout=120).run()"),
+]
+_STARTUP_SCRIPT = '''
+import sys, time
+sys.path.insert(0, {root!r})
+{setup}
+start = time.perf_counter()
+{statement}
+print(time.perf_counter() - start)
+'''
+
+
+def helper_functions():
+    """
+    List the public analysis functions of ``helper``.
+
+    Returns:
+        list: ``(name, function)`` pairs in alphabetical order.
+    """
+    return [(name, function) for name, function in inspect.getmembers(helper, inspect.isfunction)
+            if function.__module__ == 'helper' and not name.startswith('_') and name not in SKIPPED_HELPERS]
+
+
+def measure(function, repeat=3, memory=True):
+    """
+    Time a call and record the memory it allocates.
+
+    Tracing allocations slows the call down, so the peak memory comes from one extra traced run
+    and the timings from untraced runs.
+
+    Parameters:
+        function (callable): Called without arguments.
+        repeat (int): Number of timed runs.
+        memory (bool): Whether to record the peak memory with ``tracemalloc``.
+
+    Returns:
+        dict: ``seconds`` (fastest run), ``runs`` (every run) and ``peak_bytes`` (None when not
+        recorded), or ``error`` when the call raised.
+    """
+    runs = []
+    try:
+        for _ in range(repeat):
+            gc.collect()
+            start = time.perf_counter()
+            function()
+            runs.append(time.perf_counter() - start)
+
+        peak = None
+        if memory:
+            gc.collect()
+            tracemalloc.start()
+            try:
+                function()
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+    except Exception as e:
+        return {'error': f'{type(e).__name__}: {e}'}
+    return {'seconds': min(runs), 'runs': runs, 'peak_bytes': peak}
+
+
+def _indexed(df):
+    chat = ChatIndex(df)
+    # Both are built lazily on first use.
+    chat.tokens
+    chat.aggregates
+    return chat
+
+
+def _cases(text, selected_user):
+    # Each case is measured on its own; the frame and the index are built once, outside the timings.
+    data = text.encode('utf-8')
+    yield 'preprocess', lambda: preprocess(text)
+    yield 'preprocess_parallel', lambda: preprocess_parallel(data)
+
+    df = preprocess(text)
+    yield 'chat_index', lambda: _indexed(df)
+
+    chat = _indexed(df)
+    for target, source in (('frame', df), ('index', chat)):
+        for name, function in helper_functions():
+            if 'selected_user' in inspect.signature(function).parameters:
+                for user in ('Overall', selected_user):
+                    yield f'helper.{name}[{target}, {user}]', lambda f=function, u=user, s=source: f(u, s)
+            else:
+                yield f'helper.{name}[{target}]', lambda f=function, s=source: f(s)
+
+
+def run_suite(sizes=SIZES, repeat=3, memory=True, users=10, seed=0, export_format='ios', log=print):
+    """
+    Benchmark ``preprocess`` and every helper function on synthetic chats.
+
+    Parameters:
+        sizes (list): Message counts of the generated chats.
+        repeat (int): Number of timed runs per case.
+        memory (bool): Whether to record peak memory.
+        users (int): Number of chat participants.
+        seed (int): Seed of the synthetic chat generator.
+        export_format (str): Export format of the generated chats.
+        log (callable): Receives one progress line per case.
+
+    Returns:
+        dict: ``meta`` (environment and settings) and ``results`` (one dict per case and size).
+    """
+    results = []
+    for messages in sizes:
+        text = generate_chat(messages, users=users, seed=seed, export_format=export_format)
+        # The synthetic generator makes 'User 1' the busiest participant.
+        for name, function in _cases(text, 'User 1'):
+            result = {'name': name, 'messages': messages, **measure(function, repeat, memory)}
+            results.append(result)
+            log(_format_result(result))
+        del text
+        gc.collect()
+
+    meta = {'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__,
+            'platform': platform.platform(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'repeat': repeat, 'users': users, 'seed': seed, 'export_format': export_format}
+    return {'meta': meta, 'results': results}
+
+
+def run_startup(repeat=3, log=print):
+    """
+    Measure import times and the time until the app's first page is rendered.
+
+    Every run starts a new Python process, so nothing is cached in memory; the import of the
+    Streamlit test harness itself is not counted in the first render.
+
+    Parameters:
+        repeat (int): Number of fresh processes per case.
+        log (callable): Receives one progress line per case.
+
+    Returns:
+        dict: ``meta`` and ``results`` in the format of ``run_suite``, with ``messages`` set to 0.
+    """
+    results = []
+    for name, setup, statement in STARTUP_CASES:
+        script = _STARTUP_SCRIPT.format(root=ROOT, setup=setup, statement=statement)
+        try:
+            runs = []
+            for _ in range(repeat):
+                output = subprocess.run([sys.executable, '-c', script], cwd=ROOT, capture_output=True, text=True,
+                                        check=True).stdout
+                runs.append(float(output.split()[-1]))
+            result = {'name': name, 'messages': 0, 'seconds': min(runs), 'runs': runs, 'peak_bytes': None}
+        except (subprocess.CalledProcessError, ValueError, IndexError) as e:
+            result = {'name': name, 'messages': 0, 'error': f'{type(e).__name__}: {e}'}
+        results.append(result)
+        log(_format_result(result))
+
+    meta = {'python': platform.python_version(), 'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'repeat': repeat}
+    return {'meta': meta, 'results': results}
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Find the cases that got slower or use more memory than in a baseline run.
+
+    Parameters:
+        results (dict): Output of ``run_suite``.
+        baseline (dict): An earlier output of ``run_suite``.
+        threshold (float): Allowed relative increase, e.g. 0.25 for 25%.
+
+    Returns:
+        list: One dict per regression with ``name``, ``messages``, ``metric``, ``baseline``,
+        ``current`` and ``ratio``.
+    """
+    previous = {(result['name'], result['messages']): result for result in baseline['results']}
+    regressions = []
+    for result in results['results']:
+        before = previous.get((result['name'], result['messages']))
+        if before is None or 'error' in result or 'error' in before:
+            continue
+        for metric, noise in (('seconds', MIN_SECONDS), ('peak_bytes', MIN_BYTES)):
+            old, new = before.get(metric), result.get(metric)
+            if old is None or new is None:
+                continue
+            if new > old * (1 + threshold) and new - old > noise:
+                regressions.append({'name': result['name'], 'messages': result['messages'], 'metric': metric,
+                                    'baseline': old, 'current': new, 'ratio': new / old if old else float('inf')})
+    return regressions
+
+
+def _format_result(result):
+    if 'error' in result:
+        return f"{result['messages']:>9,} {result['name']:<55} error: {result['error']}"
+    peak = '' if result['peak_bytes'] is None else f"{result['peak_bytes'] / 2 ** 20:10.1f} MiB"
+    return f"{result['messages']:>9,} {result['name']:<55} {result['seconds']:9.4f} s {peak}"
+
+
+def _report(regressions, threshold):
+    if not regressions:
+        print(f'No regressions above {threshold:.0%}.')
+        return 0
+    for regression in regressions:
+        print(f"REGRESSION {regression['messages']:>9,} {regression['name']:<55} {regression['metric']}: "
+              f"{regression['baseline']:.4g} -> {regression['current']:.4g} ({regression['ratio']:.2f}x)")
+    return 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the chat parser and the helper functions.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='run the benchmark suite')
+    run.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='message counts to benchmark')
+    run.add_argument('--repeat', type=int, default=3, help='timed runs per case')
+    run.add_argument('--no-memory', action='store_true', help='skip the traced run for peak memory')
+    run.add_argument('--users', type=int, default=10)
+    run.add_argument('--seed', type=int, default=0)
+    run.add_argument('--format', default='ios', help='export format of the synthetic chats')
+    run.add_argument('--output', default='benchmark_results.json', help='where to write the results')
+    run.add_argument('--baseline', help='results file to compare against')
+    run.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+
+    startup = commands.add_parser('startup', help='measure import time and time to first render')
+    startup.add_argument('--repeat', type=int, default=3, help='fresh processes per case')
+    startup.add_argument('--output', default='startup_results.json', help='where to write the results')
+    startup.add_argument('--baseline', help='results file to compare against')
+    startup.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+
+    check = commands.add_parser('compare', help='compare two results files')
+    check.add_argument('results')
+    check.add_argument('baseline')
+    check.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+
+    generate = commands.add_parser('generate', help='write a synthetic export')
+    generate.add_argument('output')
+    generate.add_argument('--messages', type=int, default=100_000)
+    generate.add_argument('--users', type=int, default=10)
+    generate.add_argument('--seed', type=int, default=0)
+    generate.add_argument('--format', default='ios')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'generate':
+        size = write_chat(args.output, args.messages, args.users, args.seed, export_format=args.format)
+        print(f'Wrote {args.messages:,} messages ({size / 2 ** 20:.1f} MiB) to {args.output}')
+        return 0
+
+    if args.command == 'compare':
+        with open(args.results) as f:
+            results = json.load(f)
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        return _report(compare(results, baseline, args.threshold), args.threshold)
+
+    if args.command == 'startup':
+        results = run_startup(args.repeat)
+    else:
+        results = run_suite(args.sizes, args.repeat, not args.no_memory, args.users, args.seed, args.format)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Results written to {args.output}')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        return _report(compare(results, baseline, args.threshold), args.threshold)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
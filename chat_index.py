@@ -0,0 +1,147 @@
+import numpy as np
+import pandas as pd
+
+from aggregates import ChatAggregates
+from conversations import DEFAULT_GAP_MINUTES, Conversations
+from profiling import stage
+from time_range import TimeRangeIndex
+from timeline import TimelineRollups
+from vocabulary import TokenIndex
+
+
+class ChatIndex:
+    """
+    Per-user row index over a parsed chat, built once after ``preprocess``.
+
+    The user column is stored as categorical codes and the row positions of every user are
+    precomputed, so selecting one user's messages costs O(rows of that user) instead of a
+    string comparison over the whole frame. The helper functions accept a ``ChatIndex``
+    wherever they accept the DataFrame.
+
+    Parameters:
+        df (pandas.DataFrame): The DataFrame returned by ``preprocess``.
+        key (str | None): Identifier of the chat content, e.g. its ``parse_cache.content_hash``.
+        aggregates (ChatAggregates | None): Precomputed count tables; built on first use if omitted.
+    """
+
+    def __init__(self, df, key=None, aggregates=None):
+        self.df = df
+        self.key = key
+        self._aggregates = aggregates
+        self._tokens = None
+        self._timelines = {}
+        self._conversations = {}
+        self._time_range = None
+
+        users = pd.Categorical(df['user']).remove_unused_categories()
+        self.codes = users.codes
+        self.users = users.categories.tolist()
+
+        order = np.argsort(self.codes, kind='stable')
+        bounds = np.concatenate(([0], np.cumsum(np.bincount(self.codes, minlength=len(self.users)))))
+        self._positions = {user: order[bounds[i]:bounds[i + 1]] for i, user in enumerate(self.users)}
+
+    def __len__(self):
+        return len(self.df)
+
+    @property
+    def aggregates(self):
+        if self._aggregates is None:
+            tokens = self.tokens
+            with stage('chat_index.aggregates', rows=len(self.df)):
+                self._aggregates = ChatAggregates.from_frame(self.df, tokens=tokens)
+        return self._aggregates
+
+    @property
+    def tokens(self):
+        if self._tokens is None:
+            with stage('chat_index.tokens', rows=len(self.df)):
+                self._tokens = TokenIndex.from_frame(self.df)
+        return self._tokens
+
+    @property
+    def time_range(self):
+        if self._time_range is None:
+            # Word and link counts are shared with the aggregates rather than recounted.
+            tokens, links = self.tokens, self.aggregates.links
+            with stage('chat_index.time_range', rows=len(self.df)):
+                self._time_range = TimeRangeIndex.from_frame(self.df, words=tokens.row_words, links=links)
+        return self._time_range
+
+    def timeline(self, selected_user):
+        """
+        Day, week and month message totals of the selected user, built once per user.
+
+        Parameters:
+            selected_user (str): A user name, or 'Overall'.
+
+        Returns:
+            timeline.TimelineRollups: The rollups of the user's daily timeline.
+        """
+        if selected_user not in self._timelines:
+            daily = self.aggregates.daily_timeline(selected_user)
+            self._timelines[selected_user] = TimelineRollups.from_frame(daily, 'only_date', 'message')
+        return self._timelines[selected_user]
+
+    def conversations(self, gap_minutes=DEFAULT_GAP_MINUTES):
+        """
+        Conversation sessions and replies for an idle gap, built once per gap.
+
+        Parameters:
+            gap_minutes (float): Idle time that ends a conversation.
+
+        Returns:
+            conversations.Conversations: The sessions and replies of the chat.
+        """
+        if gap_minutes not in self._conversations:
+            with stage('chat_index.conversations', rows=len(self.df)):
+                self._conversations[gap_minutes] = Conversations.from_frame(self.df, gap_minutes)
+        return self._conversations[gap_minutes]
+
+    def bounds(self, selected_user='Overall'):
+        """
+        Timestamps of the selected user's first and last message, as ``TimeRangeIndex.bounds``.
+
+        Read straight from the date column, so showing the date range does not build the
+        ``time_range`` index; that is only needed once a range is actually selected.
+
+        Parameters:
+            selected_user (str): A user name, or 'Overall' for the whole chat.
+
+        Returns:
+            tuple: ``(first, last)`` as Timestamps, or ``(None, None)`` without messages.
+        """
+        dates = self.df['date'].to_numpy(dtype='datetime64[ns]')
+        if selected_user != 'Overall':
+            dates = dates[self.positions(selected_user)]
+        if not len(dates):
+            return None, None
+        return pd.Timestamp(dates.min()), pd.Timestamp(dates.max())
+
+    def positions(self, selected_user):
+        """
+        Row positions of the selected user's messages, in chat order.
+
+        Parameters:
+            selected_user (str): A user name, or 'Overall' for every row.
+
+        Returns:
+            numpy.ndarray: Integer positions into ``df``.
+        """
+        if selected_user == 'Overall':
+            return np.arange(len(self.df))
+        return self._positions.get(selected_user, np.empty(0, dtype=np.intp))
+
+    def rows(self, selected_user):
+        """
+        Messages of the selected user.
+
+        Parameters:
+            selected_user (str): A user name, or 'Overall' for the whole chat.
+
+        Returns:
+            pandas.DataFrame: The matching rows, equal to ``df[df['user'] == selected_user]``.
+        """
+        if selected_user == 'Overall':
+            return self.df
+        return self.df.take(self.positions(selected_user))
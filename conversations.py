@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+
+DEFAULT_GAP_MINUTES = 60
+
+
+class Conversations:
+    """
+    Conversation sessions and replies of a chat, found in one linear pass over its messages.
+
+    Messages are taken in time order (group notifications left out). A conversation ends when
+    nobody writes for more than ``gap_minutes``; its first message names the user who started it.
+    A message is a reply when it follows a message from someone else in the same conversation;
+    its latency is the time since that message.
+
+    Parameters:
+        sessions (pandas.DataFrame): One row per conversation: ``start``, ``end``, ``messages``,
+            ``participants`` and ``initiator``.
+        replies (pandas.DataFrame): One row per reply: ``responder``, ``author`` (of the message
+            replied to) and ``latency`` in seconds.
+        gap_minutes (float): Idle time that ends a conversation.
+    """
+
+    def __init__(self, sessions, replies, gap_minutes):
+        self.sessions = sessions
+        self.replies = replies
+        self.gap_minutes = gap_minutes
+
+    @classmethod
+    def from_frame(cls, df, gap_minutes=DEFAULT_GAP_MINUTES):
+        """
+        Segment a chat into conversations and collect its replies.
+
+        Parameters:
+            df (pandas.DataFrame): The DataFrame returned by ``preprocess``.
+            gap_minutes (float): Idle time that ends a conversation.
+
+        Returns:
+            Conversations: The sessions and replies.
+        """
+        messages = df[(df['user'] != 'group_notification').to_numpy()]
+        dates = messages['date'].to_numpy(dtype='datetime64[ns]')
+        users = pd.Categorical(messages['user']).remove_unused_categories()
+        codes = users.codes
+        if len(dates) > 1 and (np.diff(dates) < np.timedelta64(0)).any():
+            order = np.argsort(dates, kind='stable')
+            dates, codes = dates[order], codes[order]
+
+        seconds = np.diff(dates).astype('timedelta64[ns]').astype(np.int64) / 1e9
+        new_session = np.concatenate(([True], seconds > gap_minutes * 60)) if len(dates) else np.zeros(0, bool)
+        session = np.cumsum(new_session) - 1
+
+        starts = np.flatnonzero(new_session)
+        ends = np.append(starts[1:], len(dates))[:len(starts)] - 1
+        participants = pd.Series(codes).groupby(session).nunique().to_numpy() if len(dates) else np.zeros(0, int)
+        sessions = pd.DataFrame({'start': dates[starts], 'end': dates[ends], 'messages': ends - starts + 1,
+                                 'participants': participants,
+                                 'initiator': pd.Categorical.from_codes(codes[starts], users.categories)})
+
+        # A reply continues the same conversation with a different speaker.
+        is_reply = ~new_session[1:] & (codes[1:] != codes[:-1])
+        replies = pd.DataFrame({'responder': pd.Categorical.from_codes(codes[1:][is_reply], users.categories),
+                                'author': pd.Categorical.from_codes(codes[:-1][is_reply], users.categories),
+                                'latency': seconds[is_reply]})
+        return cls(sessions, replies, gap_minutes)
+
+    def involving(self, selected_user):
+        """
+        Replies written by or answering the selected user.
+
+        Parameters:
+            selected_user (str): A user name, or 'Overall' for every reply.
+
+        Returns:
+            pandas.DataFrame: The matching rows of ``replies``.
+        """
+        if selected_user == 'Overall':
+            return self.replies
+        return self.replies[(self.replies['responder'] == selected_user) | (self.replies['author'] == selected_user)]
+
+    def latency_matrix(self, selected_user='Overall'):
+        """
+        Median reply latency for every pair of users, in minutes.
+
+        Parameters:
+            selected_user (str): Restrict to replies involving this user, or 'Overall'.
+
+        Returns:
+            pandas.DataFrame: Rows are responders, columns the users they answered; NaN where a
+            pair never replied to each other.
+        """
+        replies = self.involving(selected_user)
+        matrix = (replies['latency'] / 60).groupby([replies['responder'], replies['author']], observed=True).median()
+        matrix = matrix.unstack('author')
+        matrix.index, matrix.columns = matrix.index.astype(str), matrix.columns.astype(str)
+        return matrix
+
+    def response_times(self, selected_user='Overall'):
+        """
+        Median reply latency of each responder.
+
+        Parameters:
+            selected_user (str): Only this responder, or 'Overall' for every user.
+
+        Returns:
+            pandas.DataFrame: ``User``, ``Median response (min)`` and ``Replies``, fastest first.
+        """
+        replies = self.replies
+        if selected_user != 'Overall':
+            replies = replies[replies['responder'] == selected_user]
+        grouped = (replies['latency'] / 60).groupby(replies['responder'], observed=True)
+        table = pd.DataFrame({'Median response (min)': grouped.median().round(1), 'Replies': grouped.size()})
+        table = table.rename_axis('User').reset_index().sort_values('Median response (min)', kind='stable')
+        table['User'] = table['User'].astype(str)
+        return table.reset_index(drop=True)
+
+    def initiators(self):
+        """
+        How many conversations each user started.
+
+        Returns:
+            pandas.DataFrame: ``User``, ``Conversations started`` and ``Share (%)``, most first.
+        """
+        counts = self.sessions['initiator'].value_counts()
+        counts = counts[counts > 0]
+        table = pd.DataFrame({'User': counts.index.astype(str), 'Conversations started': counts.to_numpy(),
+                              'Share (%)': (counts / counts.sum() * 100).round(2).to_numpy()})
+        return table
@@ -0,0 +1,130 @@
+import functools
+import re
+from collections import Counter
+
+import pandas as pd
+
+
+# Code points closer than this are merged into one range of the prefilter class.
+_RANGE_GAP = 256
+
+
+@functools.lru_cache(maxsize=None)
+def emoji_matchers():
+    """
+    Compile the matchers for every emoji known to the ``emoji`` package.
+
+    Scanning happens in two steps. A prefilter made of a few code point ranges finds the runs of
+    characters that may belong to an emoji; this is fast because it is one small character class.
+    The runs are then split into emojis by an exact pattern built from a trie of all sequences, so
+    a longer sequence (skin tone, ZWJ family, flag, keycap) always wins over the single emoji it
+    starts with.
+
+    Returns:
+        tuple: ``(prefilter, pattern)`` compiled regular expressions.
+    """
+    import emoji
+
+    trie = {}
+    for sequence in emoji.EMOJI_DATA:
+        node = trie
+        for char in sequence:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    ranges = []
+    for code in sorted({ord(char) for sequence in emoji.EMOJI_DATA for char in sequence if ord(char) > 127}):
+        if ranges and code - ranges[-1][1] <= _RANGE_GAP:
+            ranges[-1][1] = code
+        else:
+            ranges.append([code, code])
+    prefilter = ''.join(re.escape(chr(start)) + ('-' + re.escape(chr(end)) if end > start else '')
+                        for start, end in ranges)
+    # Keycaps are the only emojis starting with an ASCII character.
+    return re.compile(f'[{prefilter}]+|[#*0-9]\ufe0f?\u20e3'), re.compile(_trie_pattern(trie))
+
+
+def _trie_pattern(node):
+    # Characters ending a sequence with nothing after them collapse into one character class.
+    leaves = ''.join(re.escape(char) for char, child in sorted(node.items()) if char and list(child) == [''])
+    branches = [re.escape(char) + _trie_pattern(child) for char, child in sorted(node.items())
+                if char and list(child) != ['']]
+    if leaves:
+        branches.append(leaves if len(leaves) == 1 else f'[{leaves}]')
+    if not branches:
+        return ''
+
+    pattern = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+    if '' not in node:
+        return pattern
+    # Greedy optional group: the longer sequence is tried first.
+    return pattern + '?' if len(branches) == 1 and len(pattern) == 1 else f'(?:{pattern})?'
+
+
+def count_emojis(messages):
+    """
+    Count the emojis of several messages in one scan of their concatenated text.
+
+    Parameters:
+        messages (iterable): Message texts.
+
+    Returns:
+        collections.Counter: Emoji sequence to number of occurrences.
+    """
+    prefilter, pattern = emoji_matchers()
+    return Counter(match for run in prefilter.findall('\n'.join(messages)) for match in pattern.findall(run))
+
+
+def emoji_table(df):
+    """
+    Count the emojis each user sent.
+
+    Parameters:
+        df (pandas.DataFrame): The DataFrame returned by ``preprocess``.
+
+    Returns:
+        pandas.Series: Occurrences indexed by (user, emoji), sorted by index.
+    """
+    users, emojis, counts = [], [], []
+    for user, messages in df.groupby('user', observed=True, sort=True)['message']:
+        for sequence, count in count_emojis(messages).items():
+            users.append(user)
+            emojis.append(sequence)
+            counts.append(count)
+    index = pd.MultiIndex.from_arrays([pd.Index(users, dtype=object), pd.Index(emojis, dtype=object)],
+                                      names=['user', 'emoji'])
+    return pd.Series(counts, index=index, dtype='int64').sort_index()
+
+
+def emoji_name(sequence):
+    """
+    Readable name of an emoji, e.g. 'waving hand medium skin tone'.
+
+    Parameters:
+        sequence (str): The emoji.
+
+    Returns:
+        str: Its CLDR name, or an empty string when unknown.
+    """
+    import emoji
+
+    return emoji.EMOJI_DATA.get(sequence, {}).get('en', '').strip(':').replace('_', ' ')
+
+
+def top_emojis(counts, k=10):
+    """
+    The ``k`` most used emojis.
+
+    Parameters:
+        counts (pandas.Series | dict): Occurrences by emoji.
+        k (int): Number of emojis to return.
+
+    Returns:
+        pandas.DataFrame: Columns ``Emoji``, ``Name`` and ``Count``, most used first; ties in
+        code point order.
+    """
+    counts = pd.Series(counts, dtype='int64')
+    counts = counts[counts > 0].sort_index().sort_values(ascending=False, kind='stable').head(k)
+    return pd.DataFrame({'Emoji': counts.index.astype(str),
+                         'Name': [emoji_name(sequence) for sequence in counts.index],
+                         'Count': counts.to_numpy()})
@@ -0,0 +1,156 @@
+import re
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# Newer iOS exports put a narrow no-break space between the time and AM/PM.
+_AMPM = '(?:\\s|\u202f)?(?P<p>[AaPp])\\.?\\s?[Mm]\\.?'
+
+ExportFormat = namedtuple('ExportFormat', ['name', 'pattern', 'fields', 'day_first'], defaults=(None, True))
+ExportFormat.__doc__ = """
+Timestamp prefix of one WhatsApp export flavour.
+
+Parameters:
+    name (str): Identifier of the format.
+    pattern (re.Pattern): Bytes pattern of the prefix, with named groups d, m, y, H, M and
+        optionally S (seconds) and p (a/p of AM/PM).
+    fields (dict | None): Byte slices of each group for fixed-width prefixes, decoded with
+        numeric slicing; None for variable-width prefixes, decoded with ``str.extract``.
+    day_first (bool | None): Whether dates read day/month (True) or month/day (False, US exports);
+        None when ``detect_format`` could not tell from its sample. Decided once per export, so
+        every chunk of it is decoded in the same order.
+"""
+
+
+def _format(name, pattern, fields=None):
+    return ExportFormat(name, re.compile(pattern.encode('utf-8')), fields)
+
+
+# Ordered by preference: when several formats match the same sample lines equally well, the first
+# one wins, so fixed-width formats come before the variable-width ones that also match them.
+EXPORT_FORMATS = [
+    _format('ios', r'\[(?P<d>\d{2})/(?P<m>\d{2})/(?P<y>\d{2}), (?P<H>\d{2}):(?P<M>\d{2}):(?P<S>\d{2})\] ',
+            {'d': slice(1, 3), 'm': slice(4, 6), 'y': slice(7, 9),
+             'H': slice(11, 13), 'M': slice(14, 16), 'S': slice(17, 19)}),
+    _format('ios_long_year', r'\[(?P<d>\d{2})/(?P<m>\d{2})/(?P<y>\d{4}), (?P<H>\d{2}):(?P<M>\d{2}):(?P<S>\d{2})\] ',
+            {'d': slice(1, 3), 'm': slice(4, 6), 'y': slice(7, 11),
+             'H': slice(13, 15), 'M': slice(16, 18), 'S': slice(19, 21)}),
+    _format('android', r'(?m)^(?P<d>\d{2})/(?P<m>\d{2})/(?P<y>\d{4}), (?P<H>\d{2}):(?P<M>\d{2}) - ',
+            {'d': slice(0, 2), 'm': slice(3, 5), 'y': slice(6, 10), 'H': slice(12, 14), 'M': slice(15, 17)}),
+    _format('android_short_year', r'(?m)^(?P<d>\d{2})/(?P<m>\d{2})/(?P<y>\d{2}), (?P<H>\d{2}):(?P<M>\d{2}) - ',
+            {'d': slice(0, 2), 'm': slice(3, 5), 'y': slice(6, 8), 'H': slice(10, 12), 'M': slice(13, 15)}),
+    _format('ios_12h', r'\[(?P<d>\d{1,2})/(?P<m>\d{1,2})/(?P<y>\d{2,4}), '
+                       r'(?P<H>\d{1,2}):(?P<M>\d{2}):(?P<S>\d{2})' + _AMPM + r'\] '),
+    _format('android_12h', r'(?m)^(?P<d>\d{1,2})/(?P<m>\d{1,2})/(?P<y>\d{2,4}), '
+                           r'(?P<H>\d{1,2}):(?P<M>\d{2})' + _AMPM + r' - '),
+    _format('android_unpadded', r'(?m)^(?P<d>\d{1,2})/(?P<m>\d{1,2})/(?P<y>\d{2,4}), (?P<H>\d{1,2}):(?P<M>\d{2}) - '),
+]
+FORMATS_BY_NAME = {export_format.name: export_format for export_format in EXPORT_FORMATS}
+
+DETECT_SAMPLE_BYTES = 64 * 1024
+
+
+def detect_format(sample):
+    """
+    Pick the export format whose timestamp prefix starts the most lines of a sample.
+
+    Parameters:
+        sample (bytes): The first bytes of the export (``DETECT_SAMPLE_BYTES`` is plenty).
+
+    Returns:
+        ExportFormat: The best matching format, with ``day_first`` decided from the whole sample
+        (None if no date in it tells); the iOS format when nothing matches.
+    """
+    lines = sample.splitlines()[:200]
+    best, best_count = EXPORT_FORMATS[0], 0
+    for export_format in EXPORT_FORMATS:
+        count = sum(1 for line in lines if export_format.pattern.match(line))
+        if count > best_count:
+            best, best_count = export_format, count
+    return best._replace(day_first=date_order(best.pattern.finditer(sample)))
+
+
+def date_order(matches):
+    """
+    Tell day/month from month/day dates.
+
+    Parameters:
+        matches (iterable): ``re.Match`` objects of a format's pattern, in export order.
+
+    Returns:
+        bool | None: True for day/month, False for month/day, decided by the first date with a
+        field above 12; None if every date is ambiguous.
+    """
+    for match in matches:
+        if int(match.group('m')) > 12:
+            return False
+        if int(match.group('d')) > 12:
+            return True
+    return None
+
+
+def decode_timestamps(prefixes, export_format):
+    """
+    Decode timestamp prefixes into calendar fields and datetimes.
+
+    Parameters:
+        prefixes (list): Raw prefix bytes as matched by ``export_format.pattern``.
+        export_format (ExportFormat): The format the prefixes were matched with; its ``day_first``
+            decides the date order (day/month unless it is False).
+
+    Returns:
+        dict: int arrays ``year``, ``month``, ``day``, ``hour``, ``minute``, ``second`` and
+        ``weekday`` (Monday is 0), plus ``date`` as a datetime64[ns] array.
+    """
+    if not prefixes:
+        fields = {name: np.zeros(0, dtype=np.int64) for name in ('d', 'm', 'y', 'H', 'M')}
+    elif export_format.fields is not None:
+        fields = _decode_fixed_width(prefixes, export_format)
+    else:
+        fields = _decode_variable_width(prefixes, export_format)
+
+    year, month, day = fields['y'], fields['m'], fields['d']
+    year = np.where(year < 100, year + 2000, year)
+    # The order comes from the whole export, never from this batch alone: a batch whose dates
+    # are all ambiguous must still be read like the rest of its export.
+    if export_format.day_first is False:
+        month, day = day, month
+
+    hour = fields['H']
+    if 'p' in fields:
+        hour = hour % 12 + np.where(fields['p'], 12, 0)
+    minute = fields['M']
+    second = fields.get('S', np.zeros_like(minute))
+
+    days = ((year - 1970).astype('datetime64[Y]') + (month - 1).astype('timedelta64[M]')).astype('datetime64[D]') \
+        + (day - 1).astype('timedelta64[D]')
+    date = days.astype('datetime64[s]') + (hour * 3600 + minute * 60 + second).astype('timedelta64[s]')
+    weekday = (days.astype(np.int64) + 3) % 7
+
+    return {'year': year, 'month': month, 'day': day, 'hour': hour, 'minute': minute, 'second': second,
+            'weekday': weekday, 'date': date.astype('datetime64[ns]')}
+
+
+def _decode_fixed_width(prefixes, export_format):
+    # Every prefix of a fixed-width format has the same length, so they stack into a byte matrix.
+    raw = np.frombuffer(b''.join(prefixes), dtype=np.uint8).reshape(len(prefixes), -1)
+    digits = raw.astype(np.int64) - ord('0')
+
+    fields = {}
+    for name, columns in export_format.fields.items():
+        value = np.zeros(len(prefixes), dtype=np.int64)
+        for column in range(columns.start, columns.stop):
+            value = value * 10 + digits[:, column]
+        fields[name] = value
+    return fields
+
+
+def _decode_variable_width(prefixes, export_format):
+    pattern = export_format.pattern.pattern.decode('utf-8').replace('(?m)^', '')
+    groups = pd.Series(prefixes, dtype=object).str.decode('utf-8').str.extract(pattern)
+
+    fields = {name: groups[name].to_numpy(dtype=np.int64) for name in groups.columns if name != 'p'}
+    if 'p' in groups.columns:
+        fields['p'] = groups['p'].str.lower().eq('p').to_numpy()
+    return fields
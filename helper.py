@@ -1,23 +1,74 @@
+import contextvars
+import functools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas as pd
-import seaborn as sns
-from collections import Counter
-from wordcloud import WordCloud
-import matplotlib.pyplot as plt
-import emoji
-import urlextract
-import re
-from urllib.parse import urlparse
+
+from aggregates import DAYS, MEDIA_TYPES, build_link_table, media_flags
+from chat_index import ChatIndex
+from conversations import DEFAULT_GAP_MINUTES, Conversations
+from emoji_usage import count_emojis, top_emojis
+from profiling import profiled
+from sql_backend import SqlChat
+from timeline import MAX_POINTS, TimelineRollups
+from vocabulary import TokenIndex, load_stop_words
+from zip_export import ATTACHMENT_MARKERS, attached_files, attachment_summary
+
+
+WORDCLOUD_CACHE_SIZE = 32
+
+_wordcloud_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='wordcloud')
+_wordcloud_images = OrderedDict()
+_wordcloud_lock = threading.Lock()
+
+
+def _user_rows(selected_user, df):
+    if isinstance(df, ChatIndex):
+        return df.rows(selected_user)
+    if selected_user != 'Overall':
+        df = df[df['user'] == selected_user]
+    return df
+
+
+def _link_table(df):
+    # Links are extracted once at ingest; both paths read the same exploded table.
+    if isinstance(df, ChatIndex):
+        return df.aggregates.links
+    return build_link_table(df)
+
+
+def _conversations(df, gap_minutes):
+    if isinstance(df, ChatIndex):
+        return df.conversations(gap_minutes)
+    return Conversations.from_frame(df, gap_minutes)
 
 
-extract = urlextract.URLExtract()
+def _attachment_messages(selected_user, df):
+    if isinstance(df, SqlChat):
+        return df.messages(selected_user, containing=ATTACHMENT_MARKERS)
+    return _user_rows(selected_user, df)['message']
 
-def fetch_stats(selected_user, df):
+
+def _user_links(selected_user, df):
+    links = _link_table(df)
+    if selected_user != 'Overall':
+        links = links[links['user'] == selected_user]
+    return links
+
+
+@profiled('helper.fetch_stats', rows='df')
+def fetch_stats(selected_user, df, start=None, end=None):
     """
     Fetch statistics related to the WhatsApp chat data.
 
     Parameters:
         selected_user (str): The user for which statistics are fetched.
-        df (pandas.DataFrame): The DataFrame containing the WhatsApp chat data.
+        df (pandas.DataFrame | ChatIndex | SqlChat): The WhatsApp chat data, its per-user index, or
+            its on-disk store.
+        start (pandas.Timestamp | None): Only count messages sent at or after this instant.
+        end (pandas.Timestamp | None): Only count messages sent before this instant.
 
     Returns:
         tuple: A tuple containing the following statistics:
@@ -26,214 +77,422 @@ def fetch_stats(selected_user, df):
             - num_media_messages (int): The total number of media messages (images, videos, etc.) sent by the selected user.
             - num_links (int): The total number of links shared by the selected user.
     """
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+    if isinstance(df, SqlChat):
+        return df.stats(selected_user, start, end)
+    if isinstance(df, ChatIndex):
+        if start is None and end is None:
+            return df.aggregates.stats(selected_user)
+        return df.time_range.stats(selected_user, start, end)
+
+    df = _user_rows(selected_user, df)
+    if start is not None:
+        df = df[df['date'] >= start]
+    if end is not None:
+        df = df[df['date'] < end]
 
     num_messages = df.shape[0]
     words = sum(df['message'].str.split().apply(len))
     num_media_messages = df[df['message'].str.contains('image omitted')].shape[0]
 
-    links = []
-    for message in df['message']:
-        links.extend(extract.find_urls(message))
+    num_links = len(_link_table(df))
 
-    return num_messages, words, num_media_messages, len(links)
+    return num_messages, words, num_media_messages, num_links
 
+@profiled('helper.date_bounds', rows='df')
+def date_bounds(selected_user, df):
+    """
+    Find when the selected user sent their first and last message.
+
+    Parameters:
+        selected_user (str): The user whose messages are considered, or 'Overall'.
+        df (pandas.DataFrame | ChatIndex | SqlChat): The WhatsApp chat data, its per-user index, or
+            its on-disk store.
+
+    Returns:
+        tuple: The first and last message timestamps, or ``(None, None)`` without messages.
+    """
+    if isinstance(df, SqlChat):
+        return df.bounds(selected_user)
+    if isinstance(df, ChatIndex):
+        return df.bounds(selected_user)
+
+    dates = _user_rows(selected_user, df)['date']
+    if dates.empty:
+        return None, None
+    return dates.min(), dates.max()
+
+@profiled('helper.most_busy_users', rows='df')
 def most_busy_users(df):
     """
     Identify the most active users in the WhatsApp chat.
 
     Parameters:
-        df (pandas.DataFrame): The DataFrame containing the WhatsApp chat data.
+        df (pandas.DataFrame | ChatIndex | SqlChat): The WhatsApp chat data, its per-user index, or
+            its on-disk store.
 
     Returns:
         tuple: A tuple containing the following information:
             - x (pandas.Series): Series with the counts of messages sent by each user.
             - df_percent (pandas.DataFrame): DataFrame with the percentage of messages sent by each user.
     """
-    x = df['user'].value_counts().head()
-    df_percent = round((df['user'].value_counts() / df.shape[0]) * 100, 2).reset_index().rename(
+    if isinstance(df, SqlChat):
+        counts = df.busy_counts()
+    elif isinstance(df, ChatIndex):
+        counts = df.aggregates.busy_counts()
+    else:
+        counts = df['user'].value_counts()
+        counts = counts[counts > 0]
+        counts.index = counts.index.astype(str)
+
+    x = counts.head()
+    df_percent = round((counts / counts.sum()) * 100, 2).reset_index().rename(
         columns={'index': 'name', 'user': 'percent'})
     return x, df_percent
 
-def create_wordcloud(selected_user, df):
+@profiled('helper.create_wordcloud', rows='df')
+def create_wordcloud(selected_user, df, width=500, height=500):
     """
     Create a word cloud from the messages of the selected user.
 
     Parameters:
         selected_user (str): The user for which the word cloud is generated.
-        df (pandas.DataFrame): The DataFrame containing the WhatsApp chat data.
+        df (pandas.DataFrame | ChatIndex): The WhatsApp chat data, or its per-user index.
+        width (int): Width of the image in pixels.
+        height (int): Height of the image in pixels.
 
     Returns:
         wordcloud.WordCloud: Word cloud object representing the word frequencies in the messages.
     """
-    f = open('stop_hinglish.txt', 'r')
-    stop_words = f.read()
+    from wordcloud import WordCloud
 
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+    if isinstance(df, ChatIndex):
+        tokens = df.tokens
+    else:
+        tokens = TokenIndex.from_frame(_user_rows(selected_user, df))
+
+    wc = WordCloud(width=width, height=height, min_font_size=10, background_color='white')
+    df_wc = wc.generate_from_frequencies(tokens.frequencies(selected_user, load_stop_words()))
+    return df_wc
 
-    temp = df[(df['user'] != 'group_notification') & (df['message'] != '<Media omitted>\n')]
+def render_wordcloud(selected_user, chat, width=500, height=500):
+    """
+    Render the selected user's word cloud in a background thread.
 
-    def remove_stop_words(message):
-        return " ".join([word for word in message.lower().split() if word not in stop_words])
+    Rendered images are kept in a bounded cache keyed by chat, user and size, so showing a cloud
+    that was already rendered costs a dictionary lookup.
 
-    wc = WordCloud(width=500, height=500, min_font_size=10, background_color='white')
-    temp['message'] = temp['message'].apply(remove_stop_words)
-    df_wc = wc.generate(temp['message'].str.cat(sep=" "))
-    return df_wc
+    Parameters:
+        selected_user (str): The user for which the word cloud is generated.
+        chat (ChatIndex): The indexed chat; its ``key`` identifies the chat in the cache.
+        width (int): Width of the image in pixels.
+        height (int): Height of the image in pixels.
 
+    Returns:
+        concurrent.futures.Future: Resolves to the image as a numpy array.
+    """
+    key = (chat.key, selected_user, width, height)
+    with _wordcloud_lock:
+        future = _wordcloud_images.get(key)
+        if future is not None:
+            _wordcloud_images.move_to_end(key)
+            return future
+
+        # The render runs in the caller's context, so it is profiled with the session that asked for it.
+        future = _wordcloud_executor.submit(
+            contextvars.copy_context().run,
+            lambda: create_wordcloud(selected_user, chat, width=width, height=height).to_array())
+        if chat.key is None:
+            return future
+        _wordcloud_images[key] = future
+        while len(_wordcloud_images) > WORDCLOUD_CACHE_SIZE:
+            _wordcloud_images.popitem(last=False)
+
+    future.add_done_callback(functools.partial(_forget_failed_wordcloud, key))
+    return future
+
+def _forget_failed_wordcloud(key, future):
+    # Failed renders are not cached, so the next rerun retries them.
+    if future.exception() is None:
+        return
+    with _wordcloud_lock:
+        if _wordcloud_images.get(key) is future:
+            del _wordcloud_images[key]
+
+@profiled('helper.most_common_words', rows='df')
 def most_common_words(selected_user, df):
     """
     Identify the most common words used by the selected user.
 
     Parameters:
         selected_user (str): The user for which common words are identified.
-        df (pandas.DataFrame): The DataFrame containing the WhatsApp chat data.
+        df (pandas.DataFrame | ChatIndex): The WhatsApp chat data, or its per-user index.
 
     Returns:
         pandas.DataFrame: DataFrame containing the most common words and their counts.
     """
-    f = open('stop_hinglish.txt', 'r')
-    stop_words = f.read()
+    if isinstance(df, ChatIndex):
+        tokens = df.tokens
+    else:
+        tokens = TokenIndex.from_frame(_user_rows(selected_user, df))
 
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
-
-    temp = df[(df['user'] != 'group_notification') & (df['message'] != 'image omitted')]
-
-    words = [word for message in temp['message'] for word in message.lower().split() if word not in stop_words]
-    most_common_df = pd.DataFrame(Counter(words).most_common(20))
-    most_common_df.columns = ['Word', 'Count']  # Add column names for clarity
+    most_common_df = pd.DataFrame(tokens.top_words(selected_user, 20, load_stop_words()), columns=['Word', 'Count'])
     return most_common_df
 
+@profiled('helper.daily_timeline', rows='df')
 def daily_timeline(selected_user, df):
     """
     Generate a daily timeline of message counts for the selected user.
 
     Parameters:
         selected_user (str): The user for which the daily timeline is generated.
-        df (pandas.DataFrame): The DataFrame containing the WhatsApp chat data.
+        df (pandas.DataFrame | ChatIndex | SqlChat): The WhatsApp chat data, its per-user index, or
+            its on-disk store.
 
     Returns:
         pandas.DataFrame: DataFrame containing the daily message counts.
     """
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+    if isinstance(df, SqlChat):
+        return df.daily_timeline(selected_user)
+    if isinstance(df, ChatIndex):
+        return df.aggregates.daily_timeline(selected_user)
 
-    daily_timeline = df.groupby('only_date').count()['message'].reset_index()
+    df = _user_rows(selected_user, df)
+
+    daily_timeline = df.groupby('only_date', observed=True).count()['message'].reset_index()
 
     return daily_timeline
 
+@profiled('helper.message_timeline', rows='df')
+def message_timeline(selected_user, df, start=None, end=None, resolution='auto', max_points=MAX_POINTS):
+    """
+    Message counts of the selected user over time, at a resolution that keeps the chart small.
+
+    Parameters:
+        selected_user (str): The user for which the timeline is generated.
+        df (pandas.DataFrame | ChatIndex | SqlChat): The WhatsApp chat data, its per-user index, or
+            its on-disk store.
+        start (pandas.Timestamp | None): First day shown; the first message if omitted.
+        end (pandas.Timestamp | None): Last day shown; the last message if omitted.
+        resolution (str): 'day', 'week', 'month', or 'auto' to pick the finest that fits ``max_points``.
+        max_points (int): Largest number of rows returned; longer series are downsampled.
+
+    Returns:
+        tuple: DataFrame with ``date`` and ``message`` columns, and the resolution used.
+    """
+    if isinstance(df, (ChatIndex, SqlChat)):
+        rollups = df.timeline(selected_user)
+    else:
+        rollups = TimelineRollups.from_frame(daily_timeline(selected_user, df), 'only_date', 'message')
+
+    series, resolution = rollups.series(start, end, resolution, max_points)
+    return series.rename_axis('date').rename('message').reset_index(), resolution
+
+@profiled('helper.week_activity_map', rows='df')
 def week_activity_map(selected_user, df):
     """
     Generate a weekly activity map for the selected user.
 
     Parameters:
         selected_user (str): The user for which the weekly activity map is generated.
-        df (pandas.DataFrame): The DataFrame containing the WhatsApp chat data.
+        df (pandas.DataFrame | ChatIndex | SqlChat): The WhatsApp chat data, its per-user index, or
+            its on-disk store.
 
     Returns:
         pandas.Series: Series containing the number of messages for each day of the week.
     """
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+    if isinstance(df, SqlChat):
+        return df.week_activity(selected_user)
+    if isinstance(df, ChatIndex):
+        return df.aggregates.week_activity(selected_user)
+
+    df = _user_rows(selected_user, df)
 
-    return df.groupby('day_name').count()['message'].reindex(
-        ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'], fill_value=0)
+    return df.groupby('day_name', observed=True).count()['message'].reindex(DAYS, fill_value=0)
 
+@profiled('helper.activity_heatmap', rows='df')
 def activity_heatmap(selected_user, df):
     """
     Generate an activity heatmap for the selected user.
 
     Parameters:
         selected_user (str): The user for which the activity heatmap is generated.
-        df (pandas.DataFrame): The DataFrame containing the WhatsApp chat data.
+        df (pandas.DataFrame | ChatIndex | SqlChat): The WhatsApp chat data, its per-user index, or
+            its on-disk store.
 
     Returns:
         pandas.DataFrame: DataFrame representing the activity heatmap.
     """
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+    if isinstance(df, SqlChat):
+        return df.activity_heatmap(selected_user)
+    if isinstance(df, ChatIndex):
+        return df.aggregates.activity_heatmap(selected_user)
+
+    df = _user_rows(selected_user, df)
 
-    user_heatmap = df.pivot_table(index='day_name', columns='period', values='message', aggfunc='count').fillna(0)
+    user_heatmap = df.groupby(['day_name', 'period'], observed=True).size().unstack('period', fill_value=0)
 
     return user_heatmap
 
-def media_analysis(selected_user, df):
+@profiled('helper.media_analysis', rows='df')
+def media_analysis(selected_user, df, media=None):
     """
     Perform media analysis for the selected user.
 
     Parameters:
         selected_user (str): The user for which media analysis is performed.
-        df (pandas.DataFrame): The DataFrame containing the WhatsApp chat data.
+        df (pandas.DataFrame | ChatIndex | SqlChat): The WhatsApp chat data, its per-user index, or
+            its on-disk store.
+        media (pandas.DataFrame | None): The ``zip_export.media_inventory`` of a "with media" export.
 
     Returns:
         pandas.DataFrame: DataFrame containing the count of different types of media shared by the user.
+        With ``media``, the ``Files`` and ``Bytes`` columns add the number and total size of the
+        files the user attached ('Overall' counts every file of the archive).
     """
+    if isinstance(df, SqlChat):
+        table = df.media(selected_user)
+    elif isinstance(df, ChatIndex):
+        table = df.aggregates.media(selected_user)
+    else:
+        rows = _user_rows(selected_user, df)
+        table = pd.DataFrame({'Media Type': list(MEDIA_TYPES), 'Count': media_flags(rows['message']).sum().tolist()})
+
+    if media is None:
+        return table
+    files = None
     if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+        files = attached_files(_attachment_messages(selected_user, df))
+    return table.merge(attachment_summary(media, files), on='Media Type')
+
+@profiled('helper.emoji_analysis', rows='df')
+def emoji_analysis(selected_user, df):
+    """
+    Analyze the emojis used by the selected user.
 
-    media_messages = df[df['message'].str.contains('image omitted') | df['message'].str.contains('video omitted') | df[
-        'message'].str.contains('document omitted') | df['message'].str.contains('audio omitted')]
+    Parameters:
+        selected_user (str): The user for which emoji usage is analyzed.
+        df (pandas.DataFrame | ChatIndex): The WhatsApp chat data, or its per-user index.
+
+    Returns:
+        tuple: DataFrame of the ten most used emojis with their names and counts, and the average
+        number of emojis per message.
+    """
+    if isinstance(df, ChatIndex):
+        return df.aggregates.top_emojis(selected_user), df.aggregates.emojis_per_message(selected_user)
+
+    df = _user_rows(selected_user, df)
 
-    return pd.DataFrame({'Media Type': ['Images', 'Videos', 'Documents', 'Audio'],
-                         'Count': [media_messages[media_messages['message'].str.contains('image omitted')].shape[0],
-                                   media_messages[media_messages['message'].str.contains('video omitted')].shape[0],
-                                   media_messages[media_messages['message'].str.contains('document omitted')].shape[0],
-                                   media_messages[media_messages['message'].str.contains('audio omitted')].shape[0]]})
+    counts = count_emojis(df['message'])
+    emojis_per_message = sum(counts.values()) / len(df) if len(df) else 0.0
+    return top_emojis(counts), emojis_per_message
 
+@profiled('helper.message_length_analysis', rows='df')
 def message_length_analysis(selected_user, df):
     """
     Analyze the message length for the selected user.
 
     Parameters:
         selected_user (str): The user for which message length analysis is performed.
-        df (pandas.DataFrame): The DataFrame containing the WhatsApp chat data.
+        df (pandas.DataFrame | ChatIndex): The WhatsApp chat data, or its per-user index.
 
     Returns:
         pandas.DataFrame: DataFrame containing descriptive statistics of message lengths.
     """
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+    df = _user_rows(selected_user, df)
+
+    message_length = df['message'].str.len().rename('message_length')
+
+    return message_length.groupby(df['user'], observed=True).describe()
 
-    df['message_length'] = df['message'].apply(len)
+@profiled('helper.link_analysis', rows='df')
+def link_analysis(selected_user, df):
+    """
+    Analyze the links shared by the selected user.
 
-    return df.groupby('user')['message_length'].describe()
+    Parameters:
+        selected_user (str): The user whose links are analyzed, or 'Overall'.
+        df (pandas.DataFrame | ChatIndex): The WhatsApp chat data, or its per-user index.
 
-def link_analysis(df):
-    # Extract links from messages
-    links = []
-    for message in df['message']:
-        links.extend(re.findall(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', message))
+    Returns:
+        tuple: The number of unique links, the top shared domains and the number of links shared per day.
+    """
+    links = _user_links(selected_user, df)
 
     # Unique links count
-    unique_links_count = len(set(links))
+    unique_links_count = links['url'].nunique()
 
     # Top shared domains
-    domains = [urlparse(url).netloc if urlparse(url).netloc else 'N/A' for url in links]
-    top_domains = pd.DataFrame(Counter(domains).most_common(10), columns=['Domain', 'Count'])
+    top_domains = links['domain'].value_counts().head(10).reset_index()
+    top_domains.columns = ['Domain', 'Count']
 
     # Link activity over time
-    link_activity_over_time = df.groupby('only_date').size().reset_index(name='Link_Activity')
+    link_activity_over_time = links.groupby('date').size().reset_index(name='Link_Activity')
     link_activity_over_time.columns = ['Date', 'Link_Activity']  # Set the correct column names
 
     return unique_links_count, top_domains, link_activity_over_time
-    pass
 
 
-def popular_content_analysis(df):
-    # Extract content from shared links
-    content = []
-    for message in df['message']:
-        links = re.findall(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', message)
-        for link in links:
-            content.append(link)
+@profiled('helper.popular_content_analysis', rows='df')
+def popular_content_analysis(selected_user, df):
+    """
+    Find the links the selected user shared most often.
+
+    Parameters:
+        selected_user (str): The user whose links are counted, or 'Overall'.
+        df (pandas.DataFrame | ChatIndex): The WhatsApp chat data, or its per-user index.
 
-    # Calculate content frequency
-    content_frequency = Counter(content)
+    Returns:
+        pandas.DataFrame: The ten most shared links and their counts.
+    """
+    links = _user_links(selected_user, df)
 
     # Find top shared content
-    top_content = pd.DataFrame(content_frequency.most_common(10), columns=['Content', 'Count'])
+    top_content = links['url'].value_counts().head(10).reset_index()
+    top_content.columns = ['Content', 'Count']
 
     return top_content
+
+
+@profiled('helper.conversation_analysis', rows='df')
+def conversation_analysis(selected_user, df, gap_minutes=DEFAULT_GAP_MINUTES):
+    """
+    Split the chat into conversations separated by idle gaps and find who starts them.
+
+    Parameters:
+        selected_user (str): The user whose started conversations are counted, or 'Overall'.
+        df (pandas.DataFrame | ChatIndex): The WhatsApp chat data, or its per-user index.
+        gap_minutes (float): Idle time that ends a conversation.
+
+    Returns:
+        tuple: The number of conversations, how many the selected user started (all of them for
+        'Overall'), the median number of messages per conversation, and a DataFrame of how many
+        conversations each user started.
+    """
+    conversations = _conversations(df, gap_minutes)
+    sessions = conversations.sessions
+
+    if selected_user == 'Overall':
+        started = len(sessions)
+    else:
+        started = int((sessions['initiator'] == selected_user).sum())
+    median_messages = float(sessions['messages'].median()) if len(sessions) else 0.0
+
+    return len(sessions), started, median_messages, conversations.initiators()
+
+
+@profiled('helper.reply_time_analysis', rows='df')
+def reply_time_analysis(selected_user, df, gap_minutes=DEFAULT_GAP_MINUTES):
+    """
+    Measure how fast users answer each other within a conversation.
+
+    Parameters:
+        selected_user (str): The user whose replies are measured, or 'Overall'.
+        df (pandas.DataFrame | ChatIndex): The WhatsApp chat data, or its per-user index.
+        gap_minutes (float): Idle time that ends a conversation; later messages are not replies.
+
+    Returns:
+        tuple: DataFrame of median reply latency in minutes (rows reply to columns) for the pairs
+        involving the selected user, and DataFrame of each responder's median response time.
+    """
+    conversations = _conversations(df, gap_minutes)
+    return conversations.latency_matrix(selected_user), conversations.response_times(selected_user)
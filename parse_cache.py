@@ -0,0 +1,272 @@
+import hashlib
+import io
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from aggregates import ChatAggregates
+from chat_index import ChatIndex
+from export_formats import FORMATS_BY_NAME
+from preprocessor import SCHEMA_VERSION, concat_frames, detect_export_format, last_message_offset
+from profiling import stage
+
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+MEMORY_ENTRIES = 2
+# Layout of the database tables themselves, independent of the parsed frame schema. Bump it as well
+# whenever ``ChatAggregates.tables()`` gains or renames a table, or older entries fail to load.
+CACHE_LAYOUT_VERSION = 6
+
+
+def content_hash(data):
+    """
+    Hash the raw bytes of an export.
+
+    Parameters:
+        data (bytes): The raw export.
+
+    Returns:
+        str: Hex digest identifying the export content.
+    """
+    return hashlib.blake2b(memoryview(data), digest_size=16).hexdigest()
+
+
+class ParseCache:
+    """
+    Persistent cache of parsed chats stored in a SQLite database.
+
+    Each entry holds the parsed DataFrame and its ``ChatAggregates`` tables as Parquet blobs,
+    keyed by the content hash of the export and the preprocessor's ``SCHEMA_VERSION``. Entries from an older schema are never
+    returned and are dropped on open. The total payload is kept under ``max_bytes`` by evicting
+    the least recently used entries.
+
+    A re-exported chat that extends a cached export (same leading bytes, with the cached last
+    message still in place) is not parsed again: only the text from the cached last message
+    onwards is parsed and appended to the stored frame, and the stored aggregates are updated
+    with the counts of that tail instead of being rebuilt. Each entry records the export format
+    and day/month order it was parsed with; the tail is parsed with the same ones, and an export
+    whose detected order differs from the recorded one is parsed in full.
+
+    One cache is shared by every Streamlit session and the background parse threads, so the
+    database connection and the in-memory entries are only used under a lock. Full parses and
+    the serialisation of new entries run outside it.
+    """
+
+    def __init__(self, db_path, max_bytes=DEFAULT_MAX_BYTES):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        if self._conn.execute('PRAGMA user_version').fetchone()[0] != CACHE_LAYOUT_VERSION:
+            self._conn.executescript(f"""
+                DROP TABLE IF EXISTS entries;
+                DROP TABLE IF EXISTS tables;
+                DROP TABLE IF EXISTS counters;
+                PRAGMA user_version = {CACHE_LAYOUT_VERSION};
+            """)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                schema_version INTEGER NOT NULL,
+                source_size INTEGER NOT NULL,
+                last_offset INTEGER,
+                last_timestamp BLOB,
+                format TEXT NOT NULL,
+                day_first INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                frame BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+            CREATE TABLE IF NOT EXISTS tables (
+                key TEXT NOT NULL,
+                name TEXT NOT NULL,
+                payload BLOB NOT NULL,
+                PRIMARY KEY (key, name)
+            );
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+        """)
+        with self._conn:
+            self._conn.execute('DELETE FROM entries WHERE schema_version != ?', (SCHEMA_VERSION,))
+            self._conn.execute('DELETE FROM tables WHERE key NOT IN (SELECT key FROM entries)')
+
+    def get_chat(self, data, parse):
+        """
+        Return the indexed chat for ``data``, parsing and storing it on a miss.
+
+        Parameters:
+            data (bytes): The raw export.
+            parse (callable): Parser called with ``data`` on a miss, e.g. ``preprocess_parallel``;
+                the tail of an extended export is passed with an ``export_format`` keyword argument.
+
+        Returns:
+            ChatIndex: The parsed chat with its aggregates; the same object is returned while it
+            stays in memory.
+        """
+        with stage('cache.hash', rows=len(data)):
+            key = content_hash(data)
+        chat = self._find(key, data, parse)
+        if chat is None:
+            chat = ChatIndex(parse(data), key)
+        if key not in self._memory:
+            with stage('cache.put', rows=len(chat)):
+                self.put(chat, data)
+        return chat
+
+    def get_cached(self, data, parse):
+        """
+        Return the indexed chat for ``data`` if it is cached or extends a cached export.
+
+        Parameters:
+            data (bytes): The raw export.
+            parse (callable): Parser for the new tail of an extended export, called with the tail
+                and the recorded ``export_format`` keyword argument.
+
+        Returns:
+            ChatIndex | None: The chat, stored if it was extended, or None when ``data`` has to be
+            parsed in full.
+        """
+        with stage('cache.hash', rows=len(data)):
+            key = content_hash(data)
+        chat = self._find(key, data, parse)
+        if chat is not None and key not in self._memory:
+            with stage('cache.put', rows=len(chat)):
+                self.put(chat, data)
+        return chat
+
+    def _find(self, key, data, parse):
+        with self._lock:
+            with stage('cache.load'):
+                chat = self.get(key)
+            if chat is None:
+                with stage('cache.extend'):
+                    chat = self._extend(key, data, parse)
+            return chat
+
+    def get(self, key):
+        with self._lock:
+            chat = self._load(key)
+            self._count('misses' if chat is None else 'hits')
+            return chat
+
+    def put(self, chat, data):
+        export_format = detect_export_format(data)
+        last_offset, last_timestamp = last_message_offset(data, export_format)
+        frame = _to_parquet(chat.df)
+        tables = {name: _to_parquet(table) for name, table in chat.aggregates.tables().items()}
+        size = len(frame) + sum(len(payload) for payload in tables.values())
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (chat.key, SCHEMA_VERSION, len(data), last_offset, last_timestamp, export_format.name,
+                     export_format.day_first, size, time.time(), frame))
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO tables VALUES (?, ?, ?)',
+                    [(chat.key, name, payload) for name, payload in tables.items()])
+            self._remember(chat)
+            self._evict()
+
+    def _load(self, key):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self._touch(key)
+            return self._memory[key]
+
+        row = self._conn.execute(
+            'SELECT frame FROM entries WHERE key = ? AND schema_version = ?', (key, SCHEMA_VERSION)).fetchone()
+        if row is None:
+            return None
+
+        self._touch(key)
+        tables = {name: pd.read_parquet(io.BytesIO(payload))
+                  for name, payload in self._conn.execute('SELECT name, payload FROM tables WHERE key = ?', (key,))}
+        chat = ChatIndex(pd.read_parquet(io.BytesIO(row[0])), key, ChatAggregates.from_tables(tables))
+        self._remember(chat)
+        return chat
+
+    def _extend(self, new_key, data, parse):
+        # Try the largest cached exports first: they leave the shortest tail to parse.
+        candidates = self._conn.execute(
+            'SELECT key, source_size, last_offset, last_timestamp, format, day_first FROM entries '
+            'WHERE schema_version = ? AND source_size < ? AND last_offset IS NOT NULL '
+            'ORDER BY source_size DESC', (SCHEMA_VERSION, len(data))).fetchall()
+
+        view = memoryview(data)
+        detected = None
+        for key, source_size, last_offset, last_timestamp, format_name, day_first in candidates:
+            if view[last_offset:last_offset + len(last_timestamp)] != last_timestamp:
+                continue
+            # The tail alone may not tell the date order; it must be read like the cached part.
+            export_format = FORMATS_BY_NAME[format_name]._replace(day_first=bool(day_first))
+            detected = detected or detect_export_format(data)
+            if detected != export_format:
+                continue
+            if content_hash(view[:source_size]) != key:
+                continue
+            base = self._load(key)
+            if base is None:
+                continue
+
+            # The cached last message may have grown, so it is parsed again with the new tail.
+            tail = parse(bytes(view[last_offset:]), export_format=export_format)
+            kept = len(base) - 1
+            aggregates = base.aggregates.combine(ChatAggregates.from_frame(base.df.iloc[kept:], offset=kept), sign=-1)
+            aggregates = aggregates.combine(ChatAggregates.from_frame(tail, offset=kept))
+            self._count('extensions')
+            return ChatIndex(concat_frames([base.df.iloc[:kept], tail]), new_key, aggregates)
+
+        return None
+
+    def stats(self):
+        """
+        Report cache usage.
+
+        Returns:
+            dict: Hit, miss and incremental extension counters, number of stored entries and their total size in bytes.
+        """
+        with self._lock:
+            counters = dict(self._conn.execute('SELECT name, value FROM counters'))
+            entries, size = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        return {'hits': counters.get('hits', 0), 'misses': counters.get('misses', 0),
+                'extensions': counters.get('extensions', 0), 'entries': entries, 'bytes': size}
+
+    def _remember(self, chat):
+        self._memory[chat.key] = chat
+        self._memory.move_to_end(chat.key)
+        while len(self._memory) > MEMORY_ENTRIES:
+            self._memory.popitem(last=False)
+
+    def _touch(self, key):
+        with self._conn:
+            self._conn.execute('UPDATE entries SET last_access = ? WHERE key = ?', (time.time(), key))
+
+    def _count(self, name):
+        with self._conn:
+            self._conn.execute(
+                'INSERT INTO counters VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1', (name,))
+
+    def _evict(self):
+        total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        with self._conn:
+            for key, size in self._conn.execute('SELECT key, size FROM entries ORDER BY last_access').fetchall():
+                if total <= self.max_bytes:
+                    break
+                self._conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+                self._conn.execute('DELETE FROM tables WHERE key = ?', (key,))
+                self._memory.pop(key, None)
+                total -= size
+
+
+def _to_parquet(df):
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, index=False)
+    return buffer.getvalue()
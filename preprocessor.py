@@ -1,53 +1,452 @@
+import io
+import mmap
+import multiprocessing
+import os
 import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
+
+from export_formats import DETECT_SAMPLE_BYTES, FORMATS_BY_NAME, date_order, decode_timestamps, detect_format
+from profiling import RESULT, profiled, stage
+
+# Bump whenever the frame produced by the parser changes; it invalidates cached parses.
+SCHEMA_VERSION = 3
+
+USER_PATTERN = re.compile(r'([\w\W]+?):\s')
+_user_separator = re.compile(r':\s')
+LINK_PATTERN = re.compile(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
+
+# Calendar columns derivable from ``date``, stored in the narrowest integer type that fits.
+CALENDAR_COLUMNS = {'year': 'int16', 'month_num': 'int8', 'day': 'int8', 'hour': 'int8', 'minute': 'int8'}
+
+PARALLEL_WORKERS = None  # None uses every core
+PARALLEL_MIN_BYTES = 16 * 1024 * 1024
+# Shard pools are started from the threads of the Streamlit server; forking those could copy
+# locks held by other threads into the workers, which only need FORMATS_BY_NAME and their shard.
+# Windows has no forkserver and always spawns.
+POOL_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+SHARD_BYTES = 4 * 1024 * 1024
+CHUNK_ROWS = 250_000
+
+MONTH_NAMES = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October',
+               'November', 'December']
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+PERIODS = ['00-1'] + [str(hour) + "-" + str(hour + 1) for hour in range(1, 23)] + ['23-00']
+
+
+def _lookup(labels):
+    # Categorical codes for each label, with categories in the sorted order astype('category') gives.
+    categories = sorted(labels)
+    return np.array([categories.index(label) for label in labels]), categories
+
+
+_month_codes, _month_categories = _lookup(MONTH_NAMES)
+_day_codes, _day_categories = _lookup(DAY_NAMES)
+_period_codes, _period_categories = _lookup(PERIODS)
+
 
 def preprocess(data):
-    pattern = r'\[\d{2}/\d{2}/\d{2}, \d{2}:\d{2}:\d{2}\] '
-
-    messages = re.split(pattern, data)[1:]
-    dates = re.findall(pattern, data)
-
-    df = pd.DataFrame({'date': dates, 'message': messages})
-    df['date'] = pd.to_datetime(df['date'].str.extract(r'\[(.*?)\]')[0], format='%d/%m/%y, %H:%M:%S')
-
-    users = []
-    messages = []
-    links = []  # New column for links
-    for message in df['message']:
-        entry = re.split('([\w\W]+?):\s', message)
-        if entry[1:]:  # user name
-            users.append(entry[1])
-            message_text = " ".join(entry[2:])
-            messages.append(message_text)
-            extracted_links = re.findall(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', message_text)
-            links.append(", ".join(extracted_links))
-        else:
-            users.append('group_notification')
-            messages.append(entry[0])
-            links.append("")
-
-    df['user'] = users
-    df['message'] = messages
-    df['links'] = links  # Add links column
-    df['only_date'] = df['date'].dt.date
-
-    df['year'] = df['date'].dt.year
-    df['month_num'] = df['date'].dt.month
-    df['month'] = df['date'].dt.month_name()
-    df['day'] = df['date'].dt.day
-    df['day_name'] = df['date'].dt.day_name()
-    df['hour'] = df['date'].dt.hour
-    df['minute'] = df['date'].dt.minute
-
-    period = []
-    for hour in df[['day_name', 'hour']]['hour']:
-        if hour == 23:
-            period.append(str(hour) + "-" + str('00'))
-        elif hour == 0:
-            period.append(str('00') + "-" + str(hour + 1))
-        else:
-            period.append(str(hour) + "-" + str(hour + 1))
-
-    df['period'] = period
+    return preprocess_stream(data.encode('utf-8'))
+
+
+@profiled('preprocess.stream', rows=RESULT)
+def preprocess_stream(source, export_format=None):
+    """
+    Parse a WhatsApp export in a single streaming pass.
+
+    Parameters:
+        source (str | os.PathLike | bytes | file-like): Path to the export (memory-mapped), the raw
+            export bytes, or a binary file-like object such as a Streamlit upload.
+        export_format (export_formats.ExportFormat | None): Timestamp format of the export; detected
+            with ``detect_export_format`` when omitted.
+
+    Returns:
+        pandas.DataFrame: DataFrame with the same columns as ``preprocess``.
+    """
+    export_format = export_format or detect_export_format(source)
+
+    columns = _new_columns()
+    with stage('preprocess.split') as record:
+        for date, message in _iter_messages(source, export_format.pattern):
+            _append_message(columns, date, message)
+        record['rows'] = len(columns['date'])
+
+    return _build_frame(columns, export_format)
+
+
+def preprocess_chunks(source, chunk_rows=CHUNK_ROWS, export_format=None):
+    """
+    Parse a WhatsApp export into consecutive frames of at most ``chunk_rows`` messages.
+
+    Only one chunk is held in memory at a time, so exports whose parsed frame would not fit can be
+    processed piece by piece. A message is never split between two chunks.
+
+    Parameters:
+        source (str | os.PathLike | bytes | file-like): The export, as for ``preprocess_stream``.
+        chunk_rows (int): Largest number of messages per frame.
+        export_format (export_formats.ExportFormat | None): Timestamp format of the export; detected
+            with ``detect_export_format`` when omitted. Every chunk is decoded with it, so all of
+            them read their dates in the same order.
+
+    Returns:
+        generator: Frames (pandas.DataFrame) with the same columns as ``preprocess``, in chat order.
+    """
+    export_format = export_format or detect_export_format(source)
+
+    columns = _new_columns()
+    for date, message in _iter_messages(source, export_format.pattern):
+        _append_message(columns, date, message)
+        if len(columns['date']) == chunk_rows:
+            yield _build_frame(columns, export_format)
+            columns = _new_columns()
+    if columns['date']:
+        yield _build_frame(columns, export_format)
+
+
+@profiled('preprocess.parallel', rows=RESULT)
+def preprocess_parallel(source, workers=PARALLEL_WORKERS, min_bytes=PARALLEL_MIN_BYTES, export_format=None):
+    """
+    Parse a WhatsApp export on several cores.
+
+    The export is cut into shards just before a timestamp prefix, so no message is split, and the
+    shards are parsed in a process pool and merged back in order. Exports smaller than
+    ``min_bytes`` (or a single worker) are parsed in-process with ``preprocess_stream``.
+
+    Parameters:
+        source (str | os.PathLike | bytes): Path to the export or the raw export bytes.
+        workers (int | None): Number of worker processes; None uses ``os.cpu_count()``.
+        min_bytes (int): Size below which parsing stays single-process.
+        export_format (export_formats.ExportFormat | None): Timestamp format of the export; detected
+            with ``detect_export_format`` when omitted.
+
+    Returns:
+        pandas.DataFrame: DataFrame identical to the one ``preprocess_stream`` returns.
+    """
+    workers = workers or os.cpu_count() or 1
+    export_format = export_format or detect_export_format(source)
+    if workers == 1 or _source_size(source) < min_bytes:
+        return preprocess_stream(source, export_format)
+
+    shards, _ = _split_shards(source, workers, export_format)
+    columns = _new_columns()
+    with stage('preprocess.shards') as record, _shard_pool(workers) as pool:
+        for shard_columns in pool.map(_parse_shard, shards):
+            for name, values in shard_columns.items():
+                columns[name].extend(values)
+        record['rows'] = len(columns['date'])
+
+    return _build_frame(columns, export_format)
+
+
+def preprocess_shards(source, shard_bytes=SHARD_BYTES, workers=PARALLEL_WORKERS, export_format=None):
+    """
+    Parse a WhatsApp export on several cores, yielding each shard's frame as soon as it is parsed.
+
+    The export is cut into shards of about ``shard_bytes`` as in ``preprocess_parallel`` and the
+    shards are parsed in a process pool. Their frames come back in chat order while later shards
+    are still being parsed, so callers can report progress.
+
+    Parameters:
+        source (str | os.PathLike | bytes): Path to the export or the raw export bytes.
+        shard_bytes (int): Approximate size of one shard.
+        workers (int | None): Number of worker processes; None uses ``os.cpu_count()``, 1 parses
+            in-process.
+        export_format (export_formats.ExportFormat | None): Timestamp format of the export; detected
+            with ``detect_export_format`` when omitted.
+
+    Returns:
+        generator: ``(end, frame)`` pairs in chat order: the offset in the export where the shard
+        ends, and its frame with the same columns as ``preprocess``.
+    """
+    workers = workers or os.cpu_count() or 1
+    size = _source_size(source)
+    if size == 0:
+        return
+    export_format = export_format or detect_export_format(source)
+    shards, ends = _split_shards(source, -(-size // shard_bytes), export_format)
+
+    if workers == 1 or len(shards) == 1:
+        for end, shard in zip(ends, shards):
+            yield end, _build_frame(_parse_shard(shard), export_format)
+        return
+    with _shard_pool(min(workers, len(shards))) as pool:
+        for end, columns in zip(ends, pool.map(_parse_shard, shards)):
+            yield end, _build_frame(columns, export_format)
+
+
+def detect_export_format(source):
+    """
+    Detect the timestamp format of a whole export, including its day/month order.
+
+    The format comes from the first lines. When none of their dates has a field above 12, the
+    rest of the export is scanned until one does, so the order is the same for every chunk of
+    the export; an export without any such date is read day/month.
+
+    Parameters:
+        source (str | os.PathLike | bytes | file-like): The export, as for ``preprocess_stream``.
+
+    Returns:
+        export_formats.ExportFormat: The format, with ``day_first`` set.
+    """
+    export_format = detect_format(_read_head(source))
+    if export_format.day_first is None:
+        matches = (match for line in _iter_lines(source) for match in export_format.pattern.finditer(line))
+        export_format = export_format._replace(day_first=date_order(matches) is not False)
+    return export_format
+
+
+def last_message_offset(data, export_format=None):
+    """
+    Find where the last message of an export starts.
+
+    Parameters:
+        data (bytes): The raw export.
+        export_format (export_formats.ExportFormat | None): Timestamp format of the export; detected
+            from its first lines when omitted.
+
+    Returns:
+        tuple: ``(offset, timestamp)`` of the last timestamp prefix, or ``(None, None)`` when the
+        export contains no messages.
+    """
+    pattern = (export_format or detect_format(_read_head(data))).pattern
+    view = memoryview(data)
+    window = 64 * 1024
+    while True:
+        start = max(len(view) - window, 0)
+        last = None
+        for last in pattern.finditer(view, start):
+            pass
+        if last is not None:
+            return last.start(), last.group()
+        if start == 0:
+            return None, None
+        window *= 4
+
+
+def _source_size(source):
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    return len(source)
+
+
+def _shard_pool(workers):
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(POOL_START_METHOD))
+
+
+def _split_shards(source, count, export_format):
+    # Arguments of _parse_shard for up to ``count`` shards, and the offset where each shard ends.
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            cuts = _shard_boundaries(mm, count, export_format.pattern)
+        shards = [(export_format.name, (source, start, end)) for start, end in zip(cuts, cuts[1:])]
+    else:
+        view = memoryview(source)
+        cuts = _shard_boundaries(view, count, export_format.pattern)
+        shards = [(export_format.name, bytes(view[start:end])) for start, end in zip(cuts, cuts[1:])]
+    return shards, cuts[1:]
+
+
+def _shard_boundaries(buf, count, pattern):
+    # Timestamp patterns cannot overlap themselves, so every match found from an arbitrary
+    # offset is also a boundary of the full serial scan.
+    size = len(buf)
+    cuts = [0]
+    for i in range(1, count):
+        match = pattern.search(buf, i * size // count)
+        if match is None:
+            break
+        if match.start() > cuts[-1]:
+            cuts.append(match.start())
+    cuts.append(size)
+    return cuts
+
+
+def _parse_shard(args):
+    format_name, shard = args
+    if isinstance(shard, tuple):
+        path, start, end = shard
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            shard = mm[start:end]
+
+    columns = _new_columns()
+    for date, message in _iter_messages(shard, FORMATS_BY_NAME[format_name].pattern):
+        _append_message(columns, date, message)
+    return columns
+
+
+def _read_head(source):
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            return f.read(DETECT_SAMPLE_BYTES)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source[:DETECT_SAMPLE_BYTES])
+    source.seek(0)
+    head = source.read(DETECT_SAMPLE_BYTES)
+    source.seek(0)
+    return head
+
+
+def _iter_messages(source, pattern):
+    # Timestamps never span a newline, so scanning line by line finds exactly the
+    # boundaries ``re.split`` finds on the whole text, without materialising it.
+    date = None
+    parts = []
+    for line in _iter_lines(source):
+        start = 0
+        for match in pattern.finditer(line):
+            if date is not None:
+                parts.append(line[start:match.start()])
+                yield date, b''.join(parts).decode('utf-8')
+            date = match.group()
+            parts = []
+            start = match.end()
+        if date is not None:
+            parts.append(line[start:])
+
+    if date is not None:
+        yield date, b''.join(parts).decode('utf-8')
+
+
+def _iter_lines(source):
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                yield from iter(mm.readline, b'')
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        yield from io.BytesIO(source)
+    else:
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        yield from source
+
+
+def _new_columns():
+    return {'date': [], 'message': [], 'user': [], 'links': []}
+
+
+def _split_entry(message):
+    # Same pieces as USER_PATTERN.split(message): the lazy group always starts where the previous
+    # match ended and takes at least one character, so every piece between matches is empty.
+    # Scanning the separators directly avoids the regex retrying from every position.
+    entry = []
+    start = 0
+    for match in _user_separator.finditer(message):
+        if match.start() > start:
+            entry += ['', message[start:match.start()]]
+            start = match.end()
+    entry.append(message[start:])
+    return entry
+
+
+def _append_message(columns, date, message):
+    entry = _split_entry(message)
+    if entry[1:]:  # user name
+        message_text = " ".join(entry[2:])
+        columns['user'].append(sys.intern(entry[1]))
+        columns['message'].append(message_text)
+        columns['links'].append(", ".join(LINK_PATTERN.findall(message_text)))
+    else:
+        columns['user'].append('group_notification')
+        columns['message'].append(entry[0])
+        columns['links'].append("")
+    columns['date'].append(date)
+
+
+@profiled('preprocess.build_frame', rows=RESULT)
+def _build_frame(columns, export_format):
+    with stage('preprocess.decode_timestamps', rows=len(columns['date'])):
+        timestamps = decode_timestamps(columns['date'], export_format)
+    df = pd.DataFrame({'date': timestamps['date'],
+                       'message': pd.Series(columns['message'], dtype=str),
+                       'user': pd.Series(columns['user'], dtype=str).astype('category'),
+                       'links': pd.Series(columns['links'], dtype=str).astype('category')})
+    df['only_date'] = timestamps['date'].astype('datetime64[D]').astype('datetime64[ns]')
+
+    df['year'] = timestamps['year'].astype(CALENDAR_COLUMNS['year'])
+    df['month_num'] = timestamps['month'].astype(CALENDAR_COLUMNS['month_num'])
+    df['month'] = pd.Categorical.from_codes(_month_codes[timestamps['month'] - 1], _month_categories)
+    df['day'] = timestamps['day'].astype(CALENDAR_COLUMNS['day'])
+    df['day_name'] = pd.Categorical.from_codes(_day_codes[timestamps['weekday']], _day_categories)
+    df['hour'] = timestamps['hour'].astype(CALENDAR_COLUMNS['hour'])
+    df['minute'] = timestamps['minute'].astype(CALENDAR_COLUMNS['minute'])
+    df['period'] = pd.Categorical.from_codes(_period_codes[timestamps['hour']], _period_categories)
 
     return df
+
+
+def _calendar_values(date, name):
+    if name == 'month_num':
+        return date.dt.month
+    return getattr(date.dt, name)
+
+
+@profiled('preprocess.compact_frame', rows='df')
+def compact_frame(df):
+    """
+    Drop the calendar columns that can be derived from ``date``.
+
+    The dropped columns stay available through the ``df.calendar`` accessor, which derives them
+    on demand.
+
+    Parameters:
+        df (pandas.DataFrame): The DataFrame returned by ``preprocess``.
+
+    Returns:
+        pandas.DataFrame: The frame without ``year``, ``month_num``, ``day``, ``hour`` and ``minute``.
+    """
+    return df.drop(columns=[name for name in CALENDAR_COLUMNS if name in df.columns])
+
+
+def concat_frames(frames):
+    """
+    Concatenate parsed frames, keeping categorical columns categorical.
+
+    Parameters:
+        frames (list): DataFrames returned by ``preprocess``, in chat order.
+
+    Returns:
+        pandas.DataFrame: The combined frame with a fresh index.
+    """
+    df = pd.concat(frames, ignore_index=True)
+    for name, dtype in frames[0].dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            df[name] = union_categoricals([frame[name] for frame in frames], sort_categories=True)
+    return df
+
+
+def memory_report(df):
+    """
+    Report the memory used by each column of a parsed chat.
+
+    Parameters:
+        df (pandas.DataFrame): The WhatsApp chat data.
+
+    Returns:
+        pandas.DataFrame: Column name, dtype and bytes (including string contents), largest first.
+    """
+    usage = df.memory_usage(index=False, deep=True)
+    report = pd.DataFrame({'Column': usage.index, 'Dtype': df.dtypes.astype(str).to_numpy(), 'Bytes': usage.to_numpy()})
+    return report.sort_values('Bytes', ascending=False, ignore_index=True)
+
+
+@pd.api.extensions.register_dataframe_accessor('calendar')
+class CalendarAccessor:
+    """
+    Calendar columns of a parsed chat, read from the frame when stored and derived from ``date``
+    otherwise, e.g. ``df.calendar.hour``.
+    """
+
+    def __init__(self, df):
+        self._df = df
+
+    def __getattr__(self, name):
+        if name not in CALENDAR_COLUMNS:
+            raise AttributeError(name)
+        if name in self._df.columns:
+            return self._df[name]
+        return _calendar_values(self._df['date'], name).astype(CALENDAR_COLUMNS[name]).rename(name)
@@ -0,0 +1,188 @@
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import os
+import time
+from collections import deque
+
+# Pass as ``rows`` to count the rows of the returned value instead of an argument.
+RESULT = 'return'
+MAX_RECORDS = 10_000
+
+_profile = contextvars.ContextVar('profile', default=None)
+_depth = contextvars.ContextVar('profile_depth', default=0)
+_disabled = contextlib.nullcontext({})
+
+try:
+    _PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = None
+
+
+def _rss():
+    # Resident memory of the whole process; None where /proc is not available.
+    if _PAGE_SIZE is None:
+        return None
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class Profile:
+    """
+    Stage timings recorded for one session.
+
+    Every stage appends a record with its name, start (seconds since the profile was created),
+    wall time, rows processed (bytes for stages that read the raw export), change in resident
+    memory and nesting depth. The memory delta is process-wide, so stages running concurrently in
+    other sessions or threads show up in it.
+
+    Parameters:
+        max_records (int): Number of most recent records to keep.
+    """
+
+    def __init__(self, max_records=MAX_RECORDS):
+        self.records = deque(maxlen=max_records)
+        self.origin = time.perf_counter()
+        self.run = 0
+
+    def new_run(self):
+        """
+        Start a new run (e.g. a Streamlit rerun); later records are tagged with it.
+
+        Returns:
+            int: The run number.
+        """
+        self.run += 1
+        return self.run
+
+    def frame(self, run=None):
+        """
+        Records as a table.
+
+        Parameters:
+            run (int | None): Only return the records of this run.
+
+        Returns:
+            pandas.DataFrame: One row per recorded stage, in start order.
+        """
+        import pandas as pd
+
+        records = [record for record in list(self.records) if run is None or record['run'] == run]
+        columns = ['run', 'stage', 'depth', 'start', 'seconds', 'rows', 'memory_delta']
+        return pd.DataFrame(records, columns=columns).sort_values('start', kind='stable', ignore_index=True)
+
+    def to_json(self):
+        """
+        Serialize every record.
+
+        Returns:
+            str: JSON document with the records in start order.
+        """
+        return json.dumps({'records': sorted(self.records, key=lambda record: record['start'])}, indent=2)
+
+
+class _Stage:
+    __slots__ = ('profile', 'record', 'depth_token', 'memory')
+
+    def __init__(self, profile, name, rows):
+        self.profile = profile
+        self.record = {'run': profile.run, 'stage': name, 'depth': _depth.get(), 'start': None,
+                       'seconds': None, 'rows': rows, 'memory_delta': None}
+
+    def __enter__(self):
+        self.depth_token = _depth.set(self.record['depth'] + 1)
+        self.memory = _rss()
+        self.record['start'] = time.perf_counter() - self.profile.origin
+        return self.record
+
+    def __exit__(self, *exc):
+        record = self.record
+        record['seconds'] = time.perf_counter() - self.profile.origin - record['start']
+        memory = _rss()
+        if memory is not None and self.memory is not None:
+            record['memory_delta'] = memory - self.memory
+        _depth.reset(self.depth_token)
+        self.profile.records.append(record)
+        return False
+
+
+@contextlib.contextmanager
+def recording(profile):
+    """
+    Record the stages run inside the block into ``profile``.
+
+    Parameters:
+        profile (Profile | None): Where to record; None leaves profiling disabled.
+    """
+    token = _profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _profile.reset(token)
+
+
+def stage(name, rows=None):
+    """
+    Time a block of code, e.g. ``with stage('render.heatmap') as record: ...``.
+
+    When nothing is recording this returns a shared no-op context, so a disabled stage costs one
+    context variable lookup.
+
+    Parameters:
+        name (str): Stage name.
+        rows (int | None): Number of rows processed; can also be set later through ``record['rows']``.
+
+    Returns:
+        contextlib.AbstractContextManager: Yields the record dict.
+    """
+    profile = _profile.get()
+    if profile is None:
+        return _disabled
+    return _Stage(profile, name, rows)
+
+
+def profiled(name=None, rows=None):
+    """
+    Decorator recording every call of a function as a stage.
+
+    Parameters:
+        name (str | None): Stage name; defaults to ``module.function``.
+        rows (str | None): Name of the argument whose ``len()`` is the number of rows processed,
+            or ``RESULT`` to count the rows of the return value.
+
+    Returns:
+        callable: The decorator.
+    """
+    def decorate(function):
+        stage_name = name or f'{function.__module__}.{function.__name__}'
+        signature = inspect.signature(function)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            profile = _profile.get()
+            if profile is None:
+                return function(*args, **kwargs)
+
+            with _Stage(profile, stage_name, None) as record:
+                result = function(*args, **kwargs)
+                if rows == RESULT:
+                    record['rows'] = _length(result)
+                elif rows is not None:
+                    bound = signature.bind(*args, **kwargs)
+                    bound.apply_defaults()
+                    record['rows'] = _length(bound.arguments.get(rows))
+            return result
+        return wrapper
+    return decorate
+
+
+def _length(value):
+    try:
+        return len(value)
+    except TypeError:
+        return None
@@ -0,0 +1,59 @@
+import os
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
+# Same settings st.pyplot uses, so the images look as the live charts did.
+SAVE_OPTIONS = {'format': 'png', 'dpi': 200, 'bbox_inches': 'tight'}
+
+
+def demo_pie():
+    # Example data for pie chart
+    labels_pie = ['A', 'B', 'C', 'D']
+    sizes_pie = [15, 30, 45, 10]
+    explode_pie = (0, 0.1, 0, 0)  # only "explode" the 2nd slice (i.e. 'B')
+    fig1, ax1 = plt.subplots()
+    ax1.pie(sizes_pie, explode=explode_pie, labels=labels_pie, autopct='%1.1f%%', startangle=90)
+    ax1.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
+    return fig1
+
+
+def demo_bar():
+    # Example data for bar graph
+    labels_bar = ['A', 'B', 'C', 'D']
+    values1_bar = [10, 20, 30, 40]
+    values2_bar = [5, 25, 35, 45]
+    x_bar = np.arange(len(labels_bar))
+    width_bar = 0.35  # the width of the bars
+    fig2, ax2 = plt.subplots()
+    ax2.bar(x_bar - width_bar / 2, values1_bar, width_bar, label='Group 1')
+    ax2.bar(x_bar + width_bar / 2, values2_bar, width_bar, label='Group 2')
+    ax2.set_xticks(x_bar)
+    ax2.set_xticklabels(labels_bar)
+    ax2.legend()
+    return fig2
+
+
+DEMO_CHARTS = {'demo_pie.png': demo_pie, 'demo_bar.png': demo_bar}
+
+
+def main():
+    """
+    Render the example charts of the get started page into ``assets/``.
+
+    The page shows these images instead of drawing the charts on every visit; run this script again
+    after changing a chart.
+    """
+    os.makedirs(ASSETS_DIR, exist_ok=True)
+    for name, draw in DEMO_CHARTS.items():
+        fig = draw()
+        fig.savefig(os.path.join(ASSETS_DIR, name), **SAVE_OPTIONS)
+        plt.close(fig)
+        print(f'Wrote {os.path.join(ASSETS_DIR, name)}')
+
+
+if __name__ == '__main__':
+    main()
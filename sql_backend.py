@@ -0,0 +1,360 @@
+import os
+import pathlib
+import sqlite3
+import tempfile
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+
+from aggregates import DAYS, MEDIA_TYPES, media_flags
+from parse_cache import content_hash
+from preprocessor import CHUNK_ROWS, PERIODS, SCHEMA_VERSION, preprocess_chunks
+from profiling import profiled, stage
+from timeline import TimelineRollups
+
+# Exports at least this large are stored on disk and queried there instead of being parsed into memory.
+SQL_MIN_BYTES = 128 * 1024 * 1024
+STORE_DIR = 'chat_store'
+# Total size of the stored databases; the least recently opened ones are deleted beyond it.
+STORE_MAX_BYTES = 8 * 1024 * 1024 * 1024
+# Layout of the database itself, independent of the parsed frame schema.
+STORE_LAYOUT_VERSION = 1
+
+_NS_PER_DAY = 86_400 * 10 ** 9
+_MEDIA_COLUMNS = {name: name.lower() for name in MEDIA_TYPES}
+
+_SCHEMA = f"""
+    CREATE TABLE users (
+        code INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    );
+    CREATE TABLE messages (
+        row INTEGER PRIMARY KEY,
+        date INTEGER NOT NULL,
+        day INTEGER NOT NULL,
+        weekday INTEGER NOT NULL,
+        hour INTEGER NOT NULL,
+        user INTEGER NOT NULL,
+        words INTEGER NOT NULL,
+        {', '.join(f'{column} INTEGER NOT NULL' for column in _MEDIA_COLUMNS.values())},
+        links INTEGER NOT NULL,
+        message TEXT NOT NULL,
+        link_text TEXT NOT NULL
+    );
+    CREATE TABLE meta (
+        name TEXT PRIMARY KEY,
+        value
+    );
+"""
+
+# Built after the bulk load; every query below is answered from one of them.
+_INDEXES = f"""
+    CREATE INDEX messages_user_day ON messages (user, day);
+    CREATE INDEX messages_user_week ON messages (user, weekday, hour);
+    CREATE INDEX messages_user_counts ON messages (user, date, words, {', '.join(_MEDIA_COLUMNS.values())}, links);
+    CREATE INDEX messages_date_counts ON messages (date, words, images, links);
+"""
+
+
+class SqlChat:
+    """
+    A parsed chat stored in an on-disk SQLite database and analyzed with SQL queries.
+
+    Only the database pages a query touches are read, so chats far larger than memory can be
+    opened. The methods return the same values as the matching ``ChatAggregates`` and
+    ``TimeRangeIndex`` methods, and the helper functions that support this backend accept a
+    ``SqlChat`` wherever they accept the DataFrame.
+
+    Every query opens its own read-only connection, so one ``SqlChat`` can serve several
+    Streamlit sessions at once.
+
+    Parameters:
+        path (str): Database written by ``ingest``.
+        key (str | None): Identifier of the chat content, e.g. its ``parse_cache.content_hash``.
+    """
+
+    def __init__(self, path, key=None):
+        self.path = path
+        self.key = key
+        self._timelines = {}
+        self._codes = dict(self._query('SELECT name, code FROM users'))
+        self.users = sorted(self._codes)
+        self._length = self._query("SELECT value FROM meta WHERE name = 'messages'")[0][0]
+
+    def __len__(self):
+        return self._length
+
+    def _query(self, sql, parameters=()):
+        with closing(_connect_read_only(self.path)) as conn:
+            return conn.execute(sql, parameters).fetchall()
+
+    def _where(self, selected_user, start=None, end=None):
+        # None when the user has no messages, so callers can skip the query.
+        clauses, parameters = [], []
+        if selected_user != 'Overall':
+            if selected_user not in self._codes:
+                return None
+            clauses.append('user = ?')
+            parameters.append(self._codes[selected_user])
+        if start is not None:
+            clauses.append('date >= ?')
+            parameters.append(_nanoseconds(start))
+        if end is not None:
+            clauses.append('date < ?')
+            parameters.append(_nanoseconds(end))
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), parameters
+
+    def stats(self, selected_user, start=None, end=None):
+        """
+        Message, word, media and link counts, as ``helper.fetch_stats`` returns them.
+
+        Parameters:
+            selected_user (str): A user name, or 'Overall'.
+            start (pandas.Timestamp | None): First instant included; unbounded if omitted.
+            end (pandas.Timestamp | None): First instant excluded; unbounded if omitted.
+
+        Returns:
+            tuple: Number of messages, words, media messages and links.
+        """
+        where = self._where(selected_user, start, end)
+        if where is None:
+            return 0, 0, 0, 0
+        row = self._query('SELECT COUNT(*), TOTAL(words), TOTAL(images), TOTAL(links) FROM messages' + where[0],
+                          where[1])[0]
+        return tuple(int(value) for value in row)
+
+    def bounds(self, selected_user='Overall'):
+        """
+        Timestamps of the selected user's first and last message.
+
+        Parameters:
+            selected_user (str): A user name, or 'Overall'.
+
+        Returns:
+            tuple: ``(first, last)`` as Timestamps, or ``(None, None)`` without messages.
+        """
+        where = self._where(selected_user)
+        if where is None:
+            return None, None
+        # Separate subqueries, so each is a single lookup at one end of an index.
+        first, last = self._query(f'SELECT (SELECT MIN(date) FROM messages{where[0]}), '
+                                  f'(SELECT MAX(date) FROM messages{where[0]})', where[1] * 2)[0]
+        if first is None:
+            return None, None
+        return pd.Timestamp(first), pd.Timestamp(last)
+
+    def busy_counts(self):
+        rows = self._query('SELECT users.name, COUNT(*) FROM messages JOIN users ON users.code = messages.user '
+                           'GROUP BY messages.user ORDER BY 2 DESC, users.name')
+        return pd.Series([count for _, count in rows], index=pd.Index([name for name, _ in rows], name='user'),
+                         name='count', dtype='int64')
+
+    def media(self, selected_user):
+        where = self._where(selected_user)
+        counts = [0] * len(MEDIA_TYPES)
+        if where is not None:
+            totals = ', '.join(f'TOTAL({column})' for column in _MEDIA_COLUMNS.values())
+            counts = [int(value) for value in self._query(f'SELECT {totals} FROM messages' + where[0], where[1])[0]]
+        return pd.DataFrame({'Media Type': list(MEDIA_TYPES), 'Count': counts})
+
+    def messages(self, selected_user, containing=()):
+        """
+        Texts of the selected user's messages, in chat order.
+
+        Parameters:
+            selected_user (str): A user name, or 'Overall'.
+            containing (tuple): Only messages containing at least one of these strings.
+
+        Returns:
+            list: The message texts.
+        """
+        where = self._where(selected_user)
+        if where is None:
+            return []
+        sql, parameters = 'SELECT message FROM messages' + where[0], where[1]
+        if containing:
+            matches = ' OR '.join(['instr(message, ?) > 0'] * len(containing))
+            sql += f" {'AND' if where[0] else 'WHERE'} ({matches})"
+            parameters = parameters + list(containing)
+        return [message for message, in self._query(sql + ' ORDER BY row', parameters)]
+
+    def daily_timeline(self, selected_user):
+        rows = self._grouped(selected_user, 'day')
+        days = np.array([day for day, _ in rows], dtype=np.int64) * _NS_PER_DAY
+        return pd.DataFrame({'only_date': days.astype('datetime64[ns]'),
+                             'message': np.array([count for _, count in rows], dtype=np.int64)})
+
+    def week_activity(self, selected_user):
+        counts = dict(self._grouped(selected_user, 'weekday'))
+        return pd.Series([counts.get(weekday, 0) for weekday in range(len(DAYS))],
+                         index=pd.Index(DAYS, name='day_name'), name='message', dtype='int64')
+
+    def activity_heatmap(self, selected_user):
+        rows = self._grouped(selected_user, 'weekday, hour')
+        cells = pd.Series([count for *_, count in rows], dtype='int64',
+                          index=pd.MultiIndex.from_arrays([[weekday for weekday, *_ in rows],
+                                                           [hour for _, hour, _ in rows]]))
+        heatmap = cells.unstack(fill_value=0)
+        heatmap.index = pd.Index([DAYS[weekday] for weekday in heatmap.index], name='day_name')
+        heatmap.columns = pd.Index([PERIODS[hour] for hour in heatmap.columns], name='period')
+        # The parsed frame orders day and period categories by name.
+        return heatmap.sort_index().sort_index(axis=1)
+
+    def timeline(self, selected_user):
+        """
+        Day, week and month message totals of the selected user, built once per user.
+
+        Parameters:
+            selected_user (str): A user name, or 'Overall'.
+
+        Returns:
+            timeline.TimelineRollups: The rollups of the user's daily timeline.
+        """
+        if selected_user not in self._timelines:
+            daily = self.daily_timeline(selected_user)
+            self._timelines[selected_user] = TimelineRollups.from_frame(daily, 'only_date', 'message')
+        return self._timelines[selected_user]
+
+    def _grouped(self, selected_user, columns):
+        where = self._where(selected_user)
+        if where is None:
+            return []
+        return self._query(f'SELECT {columns}, COUNT(*) FROM messages{where[0]} GROUP BY {columns} ORDER BY {columns}',
+                           where[1])
+
+
+def _connect_read_only(path):
+    return sqlite3.connect(pathlib.Path(path).resolve().as_uri() + '?mode=ro', uri=True)
+
+
+def _nanoseconds(timestamp):
+    return int(pd.Timestamp(timestamp).as_unit('ns').value)
+
+
+def _message_rows(df, offset, codes):
+    # One tuple per message in the column order of the messages table.
+    message = df['message']
+    dates = df['date'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+    days = dates // _NS_PER_DAY
+    links = df['links'].astype(str)
+    flags = media_flags(message)
+    columns = [np.arange(offset, offset + len(df)), dates, days, (days + 3) % 7,  # 1970-01-01 was a Thursday
+               (dates % _NS_PER_DAY) // (3_600 * 10 ** 9),
+               [codes.setdefault(user, len(codes)) for user in df['user'].astype(str)],
+               message.str.split().str.len().to_numpy(),
+               *(flags[name].to_numpy() for name in MEDIA_TYPES),
+               np.where(links != '', links.str.count(', ') + 1, 0),
+               message, links]
+    return zip(*[column.tolist() if isinstance(column, np.ndarray) else list(column) for column in columns])
+
+
+@profiled('sql.ingest')
+def ingest(source, path, chunk_rows=CHUNK_ROWS):
+    """
+    Parse an export into a new on-disk database, one chunk at a time.
+
+    The database is written to a temporary file of its own next to ``path`` and renamed when
+    complete, so an interrupted ingest never leaves a database that looks usable, and sessions
+    ingesting the same export at once never write to the same file.
+
+    Parameters:
+        source (str | os.PathLike | bytes | file-like): The export, as for ``preprocess_stream``.
+        path (str): Database file to create; an existing file is replaced.
+        chunk_rows (int): Messages parsed and inserted at a time.
+
+    Returns:
+        str: ``path``.
+    """
+    fd, partial = tempfile.mkstemp(suffix='.partial', dir=os.path.dirname(path) or '.')
+    os.close(fd)
+    try:
+        _write_database(source, partial, chunk_rows)
+        os.replace(partial, path)
+    except BaseException:
+        os.remove(partial)
+        raise
+    return path
+
+
+def _write_database(source, path, chunk_rows):
+    codes = {}
+    rows = 0
+    placeholders = ', '.join('?' * (10 + len(_MEDIA_COLUMNS)))
+    with closing(sqlite3.connect(path)) as conn:
+        conn.executescript('PRAGMA journal_mode = OFF; PRAGMA synchronous = OFF;' + _SCHEMA)
+        with stage('sql.insert') as record:
+            for chunk in preprocess_chunks(source, chunk_rows):
+                conn.executemany(f'INSERT INTO messages VALUES ({placeholders})', _message_rows(chunk, rows, codes))
+                rows += len(chunk)
+            record['rows'] = rows
+        conn.executemany('INSERT INTO users VALUES (?, ?)', [(code, name) for name, code in codes.items()])
+        with stage('sql.index', rows=rows):
+            conn.executescript(_INDEXES)
+        conn.executemany('INSERT INTO meta VALUES (?, ?)', [('messages', rows), ('schema_version', SCHEMA_VERSION)])
+        conn.execute(f'PRAGMA user_version = {STORE_LAYOUT_VERSION}')
+        conn.commit()
+
+
+def _is_current(path):
+    try:
+        with closing(_connect_read_only(path)) as conn:
+            if conn.execute('PRAGMA user_version').fetchone()[0] != STORE_LAYOUT_VERSION:
+                return False
+            row = conn.execute("SELECT value FROM meta WHERE name = 'schema_version'").fetchone()
+    except sqlite3.Error:
+        return False
+    return row is not None and row[0] == SCHEMA_VERSION
+
+
+def open_chat(data, directory=STORE_DIR, max_bytes=STORE_MAX_BYTES):
+    """
+    Open the stored database of an export, ingesting it first if needed.
+
+    Databases are named after the content hash of the export, so uploading the same export again
+    reuses its database. Their total size is kept under ``max_bytes`` by deleting the least
+    recently opened ones; the database being opened is always kept.
+
+    Parameters:
+        data (bytes): The raw export.
+        directory (str): Directory holding the databases.
+        max_bytes (int): Size budget of the directory.
+
+    Returns:
+        SqlChat: The stored chat.
+    """
+    with stage('sql.hash', rows=len(data)):
+        key = content_hash(data)
+    path = os.path.join(directory, f'{key}.sqlite')
+    if _is_current(path):
+        # The modification time records the last use, for the eviction order.
+        os.utime(path)
+    else:
+        os.makedirs(directory, exist_ok=True)
+        ingest(data, path)
+    _evict(directory, max_bytes, keep=os.path.basename(path))
+    return SqlChat(path, key)
+
+
+def _evict(directory, max_bytes, keep):
+    stored = []
+    for entry in os.scandir(directory):
+        if not entry.name.endswith('.sqlite'):
+            continue
+        try:
+            info = entry.stat()
+        except FileNotFoundError:  # evicted by another session meanwhile
+            continue
+        stored.append((info.st_mtime, info.st_size, entry.name, entry.path))
+
+    total = sum(size for _, size, _, _ in stored)
+    for _, size, name, path in sorted(stored):
+        if total <= max_bytes:
+            break
+        if name == keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
@@ -0,0 +1,148 @@
+import numpy as np
+
+from aggregates import MEDIA_TYPES
+
+EMOJIS = ['😂', '❤️', '👍', '🙏', '😊', '🔥', '😍', '🎉', '😭', '👋🏽', '🇮🇳']
+DOMAINS = ['www.youtube.com', 'instagram.com', 'github.com', 'en.wikipedia.org', 'www.amazon.in', 'maps.google.com']
+ANDROID_MEDIA = '<Media omitted>'
+
+CHUNK_MESSAGES = 100_000
+
+
+def _prefix_writer(export_format):
+    # Each writer turns numeric timestamp fields into the prefix of one export flavour.
+    def twelve_hour(hour):
+        return hour % 12 or 12, 'AM' if hour < 12 else 'PM'
+
+    if export_format == 'ios':
+        return lambda y, m, d, H, M, S: f'[{d:02d}/{m:02d}/{y % 100:02d}, {H:02d}:{M:02d}:{S:02d}] '
+    if export_format == 'ios_long_year':
+        return lambda y, m, d, H, M, S: f'[{d:02d}/{m:02d}/{y}, {H:02d}:{M:02d}:{S:02d}] '
+    if export_format == 'android':
+        return lambda y, m, d, H, M, S: f'{d:02d}/{m:02d}/{y}, {H:02d}:{M:02d} - '
+    if export_format == 'android_short_year':
+        return lambda y, m, d, H, M, S: f'{d:02d}/{m:02d}/{y % 100:02d}, {H:02d}:{M:02d} - '
+    if export_format == 'ios_12h':
+        return lambda y, m, d, H, M, S: '[{}/{}/{:02d}, {}:{:02d}:{:02d} {}] '.format(
+            d, m, y % 100, twelve_hour(H)[0], M, S, twelve_hour(H)[1])
+    if export_format == 'android_12h':
+        return lambda y, m, d, H, M, S: '{}/{}/{:02d}, {}:{:02d} {} - '.format(
+            d, m, y % 100, twelve_hour(H)[0], M, twelve_hour(H)[1])
+    if export_format == 'android_unpadded':
+        return lambda y, m, d, H, M, S: f'{d}/{m}/{y % 100:02d}, {H}:{M:02d} - '
+    raise ValueError(f'Unknown export format: {export_format}')
+
+
+def iter_chat(messages=10_000, users=5, seed=0, multiline_rate=0.05, link_rate=0.05, media_rate=0.03,
+              emoji_rate=0.1, export_format='ios', start='2021-01-01', days=730):
+    """
+    Generate a synthetic WhatsApp export chunk by chunk.
+
+    The output only depends on the arguments: the same seed always yields the same export.
+    Message times are spread over ``days`` days from ``start``, user activity and word choice
+    follow skewed (Zipf-like) distributions, and a few messages are group notifications.
+
+    Parameters:
+        messages (int): Number of messages.
+        users (int): Number of chat participants.
+        seed (int): Seed of the random generator.
+        multiline_rate (float): Share of messages spanning several lines.
+        link_rate (float): Share of messages containing a link.
+        media_rate (float): Share of messages that are media placeholders.
+        emoji_rate (float): Share of messages containing emojis.
+        export_format (str): Name of a format in ``export_formats.EXPORT_FORMATS``.
+        start (str): Date of the first message.
+        days (int): Time span covered by the chat.
+
+    Returns:
+        generator: Chunks of the export text (str).
+    """
+    rng = np.random.default_rng(seed)
+    write_prefix = _prefix_writer(export_format)
+    media_texts = list(MEDIA_TYPES.values()) if export_format.startswith('ios') else [ANDROID_MEDIA]
+
+    names = [f'User {i + 1}' for i in range(users)]
+    user_weights = 1.0 / np.arange(1, users + 1)
+    user_weights /= user_weights.sum()
+    vocabulary = [''.join(chr(ord('a') + c) for c in rng.integers(0, 26, rng.integers(2, 9)))
+                  for _ in range(5000)]
+
+    # Sorted uniform offsets give exponential gaps between messages, like a Poisson process.
+    first = np.datetime64(start, 's')
+    offsets = np.sort(rng.integers(0, days * 86400, messages))
+
+    for chunk_start in range(0, messages, CHUNK_MESSAGES):
+        count = min(CHUNK_MESSAGES, messages - chunk_start)
+        stamps = first + offsets[chunk_start:chunk_start + count].astype('timedelta64[s]')
+        day = stamps.astype('datetime64[D]')
+        month = stamps.astype('datetime64[M]')
+        year = stamps.astype('datetime64[Y]')
+        seconds = (stamps - day).astype(np.int64)
+        fields = zip((year.astype(np.int64) + 1970).tolist(),
+                     (month.astype(np.int64) % 12 + 1).tolist(),
+                     ((day - month).astype(np.int64) + 1).tolist(),
+                     (seconds // 3600).tolist(), (seconds // 60 % 60).tolist(), (seconds % 60).tolist())
+
+        senders = rng.choice(users, size=count, p=user_weights)
+        lengths = rng.integers(1, 16, count)
+        words = np.minimum(rng.zipf(1.3, lengths.sum()), len(vocabulary)) - 1
+        ends = np.cumsum(lengths)
+        roll = rng.random((5, count))
+
+        lines = []
+        for i, (y, m, d, H, M, S) in enumerate(fields):
+            prefix = write_prefix(y, m, d, H, M, S)
+            if roll[0, i] < 0.002:
+                lines.append(f'{prefix}{names[senders[i]]} changed the group description\n')
+                continue
+            if roll[1, i] < media_rate:
+                text = media_texts[i % len(media_texts)]
+            else:
+                text = ' '.join(vocabulary[w] for w in words[ends[i] - lengths[i]:ends[i]])
+                if roll[2, i] < link_rate:
+                    text += f' https://{DOMAINS[i % len(DOMAINS)]}/{vocabulary[words[ends[i] - 1]]}/{i % 97}'
+                if roll[3, i] < emoji_rate:
+                    text += ' ' + EMOJIS[i % len(EMOJIS)] * (1 + i % 3)
+                if roll[4, i] < multiline_rate:
+                    text += '\n' + ' '.join(vocabulary[w] for w in words[ends[i] - lengths[i]:ends[i]][::-1])
+            lines.append(f'{prefix}{names[senders[i]]}: {text}\n')
+        yield ''.join(lines)
+
+
+def generate_chat(messages=10_000, users=5, seed=0, **options):
+    """
+    Generate a synthetic WhatsApp export in memory.
+
+    Parameters:
+        messages (int): Number of messages.
+        users (int): Number of chat participants.
+        seed (int): Seed of the random generator.
+        **options: Further arguments of ``iter_chat``.
+
+    Returns:
+        str: The export text.
+    """
+    return ''.join(iter_chat(messages, users, seed, **options))
+
+
+def write_chat(path, messages=10_000, users=5, seed=0, **options):
+    """
+    Write a synthetic WhatsApp export to a file without holding it in memory.
+
+    Parameters:
+        path (str | os.PathLike): Output file.
+        messages (int): Number of messages.
+        users (int): Number of chat participants.
+        seed (int): Seed of the random generator.
+        **options: Further arguments of ``iter_chat``.
+
+    Returns:
+        int: Number of bytes written.
+    """
+    size = 0
+    with open(path, 'wb') as f:
+        for chunk in iter_chat(messages, users, seed, **options):
+            data = chunk.encode('utf-8')
+            f.write(data)
+            size += len(data)
+    return size
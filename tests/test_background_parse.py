@@ -0,0 +1,23 @@
+import pandas as pd
+
+from aggregates import ChatAggregates
+from background_parse import ParseJob
+from parse_cache import content_hash
+from preprocessor import compact_frame, preprocess
+from synthetic import generate_chat
+
+
+def test_sharded_job_matches_serial_parse():
+    export = generate_chat(3_000, seed=2, multiline_rate=0.5)
+    data = export.encode('utf-8')
+
+    job = ParseJob(data, content_hash(data), shard_bytes=len(data) // 5)
+    chat = job.result(timeout=120)
+
+    expected = compact_frame(preprocess(export))
+    pd.testing.assert_frame_equal(chat.df, expected)
+    progress = job.progress()
+    assert progress['fraction'] == 1.0
+    assert progress['rows'] == len(chat)
+    for user in ['Overall'] + list(chat.users):
+        assert progress['aggregates'].stats(user) == ChatAggregates.from_frame(expected).stats(user)
@@ -0,0 +1,13 @@
+import helper
+from chat_index import ChatIndex
+from preprocessor import compact_frame, preprocess
+from synthetic import generate_chat
+
+
+def test_bounds_do_not_build_the_time_range_index():
+    chat = ChatIndex(compact_frame(preprocess(generate_chat(500, users=3, seed=4))))
+    for user in ['Overall', 'nobody'] + chat.users:
+        bounds = helper.date_bounds(user, chat)
+        assert chat._time_range is None and chat._tokens is None
+        assert bounds == chat.time_range.bounds(user)
+        chat._time_range = chat._tokens = None
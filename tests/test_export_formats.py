@@ -0,0 +1,38 @@
+import pandas as pd
+
+from export_formats import FORMATS_BY_NAME, detect_format
+from preprocessor import concat_frames, detect_export_format, preprocess_chunks, preprocess_stream
+
+
+def us_export(days):
+    # Month-first Android export, one message per day of February 2024.
+    return ''.join(f'02/{day:02d}/2024, 10:{day:02d} - Ann: day {day}\n' for day in days).encode('utf-8')
+
+
+def test_detect_format_reads_order_from_whole_sample():
+    assert detect_format(us_export(range(1, 20))).day_first is False
+    assert detect_format(b'13/02/2024, 10:00 - Ann: hi\n').day_first is True
+    assert detect_format(us_export(range(1, 10))).day_first is None
+
+
+def test_detect_export_format_scans_past_ambiguous_head():
+    export_format = detect_export_format(us_export(range(1, 29)))
+    assert export_format.name == 'android'
+    assert export_format.day_first is False
+    assert detect_export_format(us_export(range(1, 10))).day_first is True
+
+
+def test_chunks_share_the_export_date_order():
+    data = us_export(range(1, 29))
+    chunks = list(preprocess_chunks(data, chunk_rows=5))
+
+    # The first chunks only hold days 1-12, which read as valid day/month dates on their own.
+    assert chunks[0]['date'].iloc[0] == pd.Timestamp('2024-02-01 10:01')
+    pd.testing.assert_frame_equal(concat_frames(chunks), preprocess_stream(data))
+    assert preprocess_stream(data)['date'].dt.month.eq(2).all()
+
+
+def test_explicit_order_overrides_detection():
+    month_first = FORMATS_BY_NAME['android']._replace(day_first=False)
+    df = preprocess_stream(us_export([5]), month_first)
+    assert df['date'].iloc[0] == pd.Timestamp('2024-02-05 10:05')
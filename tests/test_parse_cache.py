@@ -0,0 +1,56 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from parse_cache import ParseCache
+from preprocessor import preprocess_parallel
+from synthetic import generate_chat
+
+
+def us_export(month, days):
+    # Month-first Android export, one message per day.
+    return ''.join(f'{month:02d}/{day:02d}/2024, 10:{day:02d} - Ann: day {day}\n' for day in days).encode('utf-8')
+
+
+def test_month_first_export_extended_with_ambiguous_tail(tmp_path):
+    cache = ParseCache(str(tmp_path / 'cache.db'))
+    base = us_export(2, range(13, 29)) + us_export(3, range(1, 6))
+    cache.get_chat(base, preprocess_parallel)
+
+    # The tail is parsed from the cached last message (March 5th) on, and every date in it also
+    # reads as a valid day/month date.
+    extended = base + us_export(3, range(6, 11))
+    chat = cache.get_chat(extended, preprocess_parallel)
+
+    assert cache.stats()['extensions'] == 1
+    pd.testing.assert_frame_equal(chat.df, preprocess_parallel(extended))
+    assert chat.df['date'].iloc[-1] == pd.Timestamp('2024-03-10 10:10')
+
+
+def test_extension_revealing_another_date_order_is_parsed_in_full(tmp_path):
+    cache = ParseCache(str(tmp_path / 'cache.db'))
+    # Nothing in the cached export tells its order, so it was read day/month.
+    base = us_export(2, range(1, 10))
+    cache.get_chat(base, preprocess_parallel)
+
+    extended = base + us_export(2, range(10, 20))
+    chat = cache.get_chat(extended, preprocess_parallel)
+
+    assert cache.stats()['extensions'] == 0
+    assert chat.df['date'].dt.month.eq(2).all()
+
+
+def test_shared_between_threads(tmp_path):
+    # More exports than MEMORY_ENTRIES and a tight byte budget, so threads keep evicting each other.
+    exports = [generate_chat(200, seed=seed).encode('utf-8') for seed in range(6)]
+    cache = ParseCache(str(tmp_path / 'cache.db'), max_bytes=200_000)
+
+    def work(worker):
+        for i in range(12):
+            data = exports[(worker + i) % len(exports)]
+            assert len(cache.get_chat(data, preprocess_parallel)) == 200
+            cache.stats()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(work, range(8)))
+    assert cache.stats()['hits'] + cache.stats()['misses'] == 8 * 12
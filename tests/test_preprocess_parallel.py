@@ -0,0 +1,27 @@
+import pandas as pd
+import pytest
+
+from preprocessor import preprocess, preprocess_parallel
+from synthetic import generate_chat
+
+
+@pytest.fixture(params=['android', 'ios'])
+def export(request):
+    # Every message spans several lines, so shard cut points fall inside multi-line messages.
+    return generate_chat(2_000, seed=1, multiline_rate=1.0, export_format=request.param)
+
+
+@pytest.mark.parametrize('workers', [2, 3, 7])
+def test_sharded_parse_matches_serial_parse(export, workers):
+    expected = preprocess(export)
+    assert expected['message'].str.contains('\n').all()
+
+    result = preprocess_parallel(export.encode('utf-8'), workers=workers, min_bytes=0)
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_sharded_parse_of_file_matches_serial_parse(export, tmp_path):
+    path = tmp_path / 'chat.txt'
+    path.write_bytes(export.encode('utf-8'))
+
+    pd.testing.assert_frame_equal(preprocess_parallel(str(path), workers=4, min_bytes=0), preprocess(export))
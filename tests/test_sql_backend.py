@@ -0,0 +1,73 @@
+import os
+
+import pandas as pd
+import pytest
+
+import helper
+from chat_index import ChatIndex
+from preprocessor import compact_frame, preprocess
+from sql_backend import SqlChat, ingest, open_chat
+from synthetic import generate_chat
+
+
+@pytest.fixture(scope='module')
+def chats(tmp_path_factory):
+    export = generate_chat(3_000, users=4, seed=3, media_rate=0.1)
+    path = str(tmp_path_factory.mktemp('store') / 'chat.sqlite')
+    # Small chunks, so users and rows are numbered across several inserts.
+    ingest(export.encode('utf-8'), path, chunk_rows=700)
+    return SqlChat(path), ChatIndex(compact_frame(preprocess(export)))
+
+
+def assert_same(result, expected):
+    if isinstance(expected, pd.DataFrame):
+        pd.testing.assert_frame_equal(result, expected)
+    elif isinstance(expected, pd.Series):
+        pd.testing.assert_series_equal(result, expected)
+    elif isinstance(expected, tuple):
+        assert len(result) == len(expected)
+        for part, expected_part in zip(result, expected):
+            assert_same(part, expected_part)
+    else:
+        assert result == expected
+
+
+@pytest.mark.parametrize('section', ['fetch_stats', 'date_bounds', 'daily_timeline', 'message_timeline',
+                                     'week_activity_map', 'activity_heatmap', 'media_analysis'])
+def test_sql_chat_matches_pandas_helpers(chats, section):
+    sql_chat, chat = chats
+    assert sql_chat.users == chat.users
+    for user in ['Overall'] + chat.users:
+        function = getattr(helper, section)
+        assert_same(function(user, sql_chat), function(user, chat))
+
+
+def test_sql_chat_matches_pandas_date_ranges_and_busy_users(chats):
+    sql_chat, chat = chats
+    first, last = helper.date_bounds('Overall', chat)
+    start, end = first + (last - first) / 3, last - (last - first) / 3
+    for user in ['Overall'] + chat.users:
+        assert helper.fetch_stats(user, sql_chat, start, end) == helper.fetch_stats(user, chat, start, end)
+    assert_same(helper.most_busy_users(sql_chat), helper.most_busy_users(chat))
+
+
+def test_store_evicts_least_recently_opened(tmp_path):
+    exports = [generate_chat(300, seed=seed).encode('utf-8') for seed in range(3)]
+    directory = str(tmp_path / 'store')
+    first = open_chat(exports[0], directory)
+    budget = 2 * os.path.getsize(first.path) + os.path.getsize(first.path) // 2
+
+    second = open_chat(exports[1], directory, max_bytes=budget)
+    os.utime(second.path, (0, 0))
+    open_chat(exports[0], directory, max_bytes=budget)  # reopening counts as a use
+    third = open_chat(exports[2], directory, max_bytes=budget)
+
+    stored = sorted(os.listdir(directory))
+    assert stored == sorted(os.path.basename(chat.path) for chat in (first, third))
+
+
+def test_ingest_leaves_no_temporary_files(tmp_path):
+    path = str(tmp_path / 'chat.sqlite')
+    ingest(generate_chat(100).encode('utf-8'), path)
+    ingest(generate_chat(100).encode('utf-8'), path)
+    assert os.listdir(tmp_path) == ['chat.sqlite']
@@ -0,0 +1,27 @@
+import io
+import zipfile
+
+import pytest
+
+from synthetic import generate_chat
+from zip_export import read_export
+
+
+def archive(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zf:
+        for name, content in members.items():
+            zf.writestr(name, content)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize('chat_name', ['WhatsApp Chat with Team.txt', 'Chat de WhatsApp con Team.txt'])
+def test_android_chat_is_found_next_to_text_attachments(chat_name):
+    chat = generate_chat(50, export_format='android').encode('utf-8')
+    data = archive({'Agenda.txt': b'meeting notes\n', chat_name: chat, 'IMG-20240101-WA0001.jpg': b'jpeg'})
+
+    text, inventory = read_export(data)
+
+    assert text == chat
+    assert sorted(inventory['file']) == ['Agenda.txt', 'IMG-20240101-WA0001.jpg']
+    assert inventory.set_index('file').loc['Agenda.txt', 'Media Type'] == 'Documents'
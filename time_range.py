@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+
+from aggregates import build_link_table, media_flags
+
+# Counted quantities, in the order ``helper.fetch_stats`` returns them.
+STAT_COLUMNS = ('messages', 'words', 'media', 'links')
+
+
+class TimeRangeIndex:
+    """
+    Message, word, media and link counts of any user over any time range, in O(log n).
+
+    Rows are sorted by user and then by date, and the counts are stored as one running total over
+    that order. Every user's messages form a contiguous, date-sorted block, so the counts of a range
+    are two ``searchsorted`` calls on the block's dates and one subtraction of running totals. The
+    same is kept for the whole chat in date order, for 'Overall'.
+
+    Parameters:
+        dates (numpy.ndarray): Timestamp of every message, as ``datetime64[ns]``.
+        codes (numpy.ndarray): User code of every message.
+        users (list): User names, indexed by code.
+        counts (numpy.ndarray): One row per message and one column per ``STAT_COLUMNS`` entry.
+    """
+
+    def __init__(self, dates, codes, users, counts):
+        self.users = list(users)
+
+        order = np.argsort(dates, kind='stable')
+        self._dates = dates[order]
+        self._totals = _running_totals(counts[order])
+
+        # Sorting by date first keeps the per-user blocks in date order.
+        by_user = order[np.argsort(codes[order], kind='stable')]
+        self._user_dates = dates[by_user]
+        self._user_totals = _running_totals(counts[by_user])
+        bounds = np.concatenate(([0], np.cumsum(np.bincount(codes, minlength=len(self.users)))))
+        self._blocks = {user: (bounds[i], bounds[i + 1]) for i, user in enumerate(self.users)}
+
+    @classmethod
+    def from_frame(cls, df, words=None, links=None):
+        """
+        Build the index from a DataFrame returned by ``preprocess``.
+
+        Parameters:
+            df (pandas.DataFrame): The WhatsApp chat data.
+            words (numpy.ndarray | None): Words of every message, e.g. ``TokenIndex.row_words``;
+                counted from the text if omitted.
+            links (pandas.DataFrame | None): The link table of ``df`` (see
+                ``aggregates.build_link_table``); built if omitted.
+
+        Returns:
+            TimeRangeIndex: The index.
+        """
+        message = df['message']
+        if words is None:
+            words = message.str.split().str.len().to_numpy()
+        if links is None:
+            links = build_link_table(df)
+        counts = np.column_stack([np.ones(len(df), dtype=np.int64),
+                                  np.asarray(words, dtype=np.int64),
+                                  media_flags(message)['Images'].to_numpy(dtype=np.int64),
+                                  np.bincount(links['row'], minlength=len(df))])
+
+        users = pd.Categorical(df['user']).remove_unused_categories()
+        return cls(df['date'].to_numpy(dtype='datetime64[ns]'), users.codes, users.categories, counts)
+
+    def bounds(self, selected_user='Overall'):
+        """
+        Timestamps of the selected user's first and last message.
+
+        Parameters:
+            selected_user (str): A user name, or 'Overall' for the whole chat.
+
+        Returns:
+            tuple: ``(first, last)`` as Timestamps, or ``(None, None)`` without messages.
+        """
+        dates = self._dates
+        if selected_user != 'Overall':
+            first, last = self._blocks.get(selected_user, (0, 0))
+            dates = self._user_dates[first:last]
+        if not len(dates):
+            return None, None
+        return pd.Timestamp(dates[0]), pd.Timestamp(dates[-1])
+
+    def stats(self, selected_user, start=None, end=None):
+        """
+        Counts of the selected user's messages sent in ``[start, end)``.
+
+        Parameters:
+            selected_user (str): A user name, or 'Overall' for the whole chat.
+            start (pandas.Timestamp | None): First instant included; unbounded if omitted.
+            end (pandas.Timestamp | None): First instant excluded; unbounded if omitted.
+
+        Returns:
+            tuple: Number of messages, words, media messages and links, as ``helper.fetch_stats``.
+        """
+        if selected_user == 'Overall':
+            dates, totals, offset = self._dates, self._totals, 0
+        elif selected_user in self._blocks:
+            first, last = self._blocks[selected_user]
+            dates, totals, offset = self._user_dates[first:last], self._user_totals, first
+        else:
+            return (0,) * len(STAT_COLUMNS)
+
+        low = 0 if start is None else dates.searchsorted(pd.Timestamp(start).to_datetime64(), 'left')
+        high = len(dates) if end is None else dates.searchsorted(pd.Timestamp(end).to_datetime64(), 'left')
+        high = max(low, high)
+        return tuple(int(count) for count in totals[offset + high] - totals[offset + low])
+
+
+def _running_totals(counts):
+    # Row i holds the sum of the first i rows, so any block sums with one subtraction.
+    totals = np.zeros((len(counts) + 1, counts.shape[1]), dtype=np.int64)
+    np.cumsum(counts, axis=0, out=totals[1:])
+    return totals
@@ -0,0 +1,163 @@
+import numpy as np
+import pandas as pd
+
+# Resample rules; weeks start on Monday and are labelled with that Monday.
+RESOLUTIONS = {'day': 'D', 'week': 'W-MON', 'month': 'MS'}
+DAYS_PER_POINT = {'day': 1, 'week': 7, 'month': 30.44}
+MAX_POINTS = 400
+
+
+def lttb(x, y, threshold):
+    """
+    Pick the points of a series that best preserve its shape (Largest-Triangle-Three-Buckets).
+
+    Parameters:
+        x (numpy.ndarray): Increasing x values.
+        y (numpy.ndarray): Values at ``x``.
+        threshold (int): Number of points to keep.
+
+    Returns:
+        numpy.ndarray: Sorted positions of the kept points; the first and last point are always kept.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    every = (n - 2) / (threshold - 2)
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+
+    previous = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+        next_end = min(int((bucket + 2) * every) + 1, n)
+        # The third corner of the triangle is the average of the next bucket.
+        next_x, next_y = x[end:next_end].mean(), y[end:next_end].mean()
+
+        area = np.abs((x[previous] - next_x) * (y[start:end] - y[previous])
+                      - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(area.argmax())
+        kept[bucket + 1] = previous
+    return kept
+
+
+class TimelineRollups:
+    """
+    Day, week and month totals of a daily series, computed once.
+
+    A chart asks for the range it shows and gets the finest resolution that fits in ``max_points``.
+    Ranges too long even for monthly points are downsampled with ``lttb``, so the number of points
+    sent to the browser is bounded whatever the length of the chat.
+
+    Parameters:
+        daily (pandas.Series): Totals indexed by day; days without activity may be missing.
+    """
+
+    def __init__(self, daily):
+        daily = daily.groupby(pd.DatetimeIndex(daily.index)).sum().sort_index()
+        self.levels = {'day': daily}
+        for name, rule in RESOLUTIONS.items():
+            if name != 'day':
+                self.levels[name] = daily.resample(rule, label='left', closed='left').sum()
+
+    @classmethod
+    def from_frame(cls, frame, date_column, value_column):
+        """
+        Build the rollups from a daily table such as the one ``helper.daily_timeline`` returns.
+
+        Parameters:
+            frame (pandas.DataFrame): One row per day.
+            date_column (str): Column with the day.
+            value_column (str): Column with the total of that day.
+
+        Returns:
+            TimelineRollups: The rollups.
+        """
+        return cls(frame.set_index(date_column)[value_column])
+
+    def bounds(self):
+        """
+        First and last day of the series.
+
+        Returns:
+            tuple: ``(first, last)`` as Timestamps, or ``(None, None)`` for an empty series.
+        """
+        days = self.levels['day'].index
+        if days.empty:
+            return None, None
+        return days[0], days[-1]
+
+    def resolution_for(self, start=None, end=None, max_points=MAX_POINTS):
+        """
+        Choose the finest resolution that shows a range in at most ``max_points`` points.
+
+        Parameters:
+            start (pandas.Timestamp | None): First day shown; the start of the series if omitted.
+            end (pandas.Timestamp | None): Last day shown; the end of the series if omitted.
+            max_points (int): Largest number of points wanted.
+
+        Returns:
+            str: A key of ``RESOLUTIONS``; 'month' when even months exceed ``max_points``.
+        """
+        first, last = self.bounds()
+        if first is None:
+            return 'day'
+        start = pd.Timestamp(start) if start is not None else first
+        end = pd.Timestamp(end) if end is not None else last
+        days = (end - start).days + 1
+        for name in RESOLUTIONS:
+            if days / DAYS_PER_POINT[name] <= max_points:
+                return name
+        return 'month'
+
+    def series(self, start=None, end=None, resolution='auto', max_points=MAX_POINTS, downsample=True):
+        """
+        The totals of a range at a bounded number of points.
+
+        Parameters:
+            start (pandas.Timestamp | None): First day shown; the start of the series if omitted.
+            end (pandas.Timestamp | None): Last day shown; the end of the series if omitted.
+            resolution (str): A key of ``RESOLUTIONS``, or 'auto' to use ``resolution_for``.
+            max_points (int): Largest number of points wanted.
+            downsample (bool): Whether to reduce longer series to ``max_points`` with ``lttb``.
+
+        Returns:
+            tuple: ``(series, resolution)``; the series is indexed by the start of each period.
+        """
+        if resolution == 'auto':
+            resolution = self.resolution_for(start, end, max_points)
+        series = self.levels[resolution]
+        if start is not None:
+            # The period containing ``start`` is shown whole.
+            period = {'day': 'D', 'week': 'W-SUN', 'month': 'M'}[resolution]
+            series = series[series.index >= pd.Timestamp(start).to_period(period).start_time]
+        if end is not None:
+            series = series[series.index <= pd.Timestamp(end)]
+
+        if downsample and len(series) > max_points:
+            x = (series.index - series.index[0]) / pd.Timedelta(days=1)
+            series = series.iloc[lttb(x, series.to_numpy(), max_points)]
+        return series, resolution
+
+
+def bounded_timeline(frame, date_column, value_column, start=None, end=None, max_points=MAX_POINTS):
+    """
+    Reduce a daily table to at most ``max_points`` rows for charting.
+
+    Parameters:
+        frame (pandas.DataFrame): One row per day.
+        date_column (str): Column with the day.
+        value_column (str): Column with the total of that day.
+        start (pandas.Timestamp | None): First day shown.
+        end (pandas.Timestamp | None): Last day shown.
+        max_points (int): Largest number of rows returned.
+
+    Returns:
+        tuple: ``(table, resolution)``; the table has the same two columns as ``frame``.
+    """
+    series, resolution = TimelineRollups.from_frame(frame, date_column, value_column).series(
+        start, end, max_points=max_points)
+    return series.rename_axis(date_column).rename(value_column).reset_index(), resolution
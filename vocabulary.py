@@ -0,0 +1,129 @@
+import functools
+import heapq
+
+import numpy as np
+import pandas as pd
+
+STOP_WORDS_PATH = 'stop_hinglish.txt'
+
+_placeholder_pattern = r'<Media omitted>|(?:image|video|document|audio) omitted'
+
+
+@functools.lru_cache(maxsize=None)
+def load_stop_words(path=STOP_WORDS_PATH):
+    """
+    Read the stop-word list once.
+
+    Parameters:
+        path (str): File with whitespace-separated stop words.
+
+    Returns:
+        frozenset: The stop words.
+    """
+    with open(path, 'r') as f:
+        return frozenset(f.read().split())
+
+
+class TokenIndex:
+    """
+    Tokenized messages of a chat with per-user term frequencies, built once per chat.
+
+    Messages are lower-cased and split on whitespace a single time. Every token is interned as
+    an integer id into ``vocabulary``, and the counts per (user, token) are stored as a sorted
+    sparse table. Word statistics only count messages from real users that are not media
+    placeholders; the per-message token counts cover every message, as ``fetch_stats`` does.
+
+    Parameters:
+        vocabulary (numpy.ndarray): Token text by id.
+        users (list): User names; position is the user code.
+        row_words (numpy.ndarray): Number of tokens in each message.
+        keys (numpy.ndarray): Sorted ``user_code * len(vocabulary) + token_id`` of counted terms.
+        counts (numpy.ndarray): Term frequency for each entry of ``keys``.
+    """
+
+    def __init__(self, vocabulary, users, row_words, keys, counts):
+        self.vocabulary = vocabulary
+        self.users = users
+        self.row_words = row_words
+        self._keys = keys
+        self._counts = counts
+        self._user_codes = {user: code for code, user in enumerate(users)}
+
+    @classmethod
+    def from_frame(cls, df):
+        """
+        Tokenize the messages of a chat.
+
+        Parameters:
+            df (pandas.DataFrame): The DataFrame returned by ``preprocess``.
+
+        Returns:
+            TokenIndex: The index.
+        """
+        tokens = df['message'].str.lower().str.split()
+        row_words = tokens.str.len().to_numpy(dtype=np.int64)
+
+        users = pd.Categorical(df['user']).remove_unused_categories()
+        counted = ((df['user'] != 'group_notification')
+                   & ~df['message'].str.contains(_placeholder_pattern, regex=True)).to_numpy()
+
+        flat = tokens[counted].explode().dropna()
+        token_ids, vocabulary = pd.factorize(flat, sort=False)
+        user_codes = np.repeat(users.codes[counted], row_words[counted]).astype(np.int64)
+
+        keys, counts = np.unique(user_codes * len(vocabulary) + token_ids, return_counts=True)
+        return cls(np.asarray(vocabulary, dtype=object), users.categories.tolist(), row_words, keys, counts)
+
+    def term_counts(self, selected_user):
+        """
+        Sparse term frequencies of the selected user.
+
+        Parameters:
+            selected_user (str): A user name, or 'Overall'.
+
+        Returns:
+            tuple: ``(token_ids, counts)`` arrays.
+        """
+        size = len(self.vocabulary)
+        if selected_user == 'Overall':
+            counts = np.bincount(self._keys % size, weights=self._counts, minlength=size).astype(np.int64)
+            token_ids = np.flatnonzero(counts)
+            return token_ids, counts[token_ids]
+
+        code = self._user_codes.get(selected_user)
+        if code is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        start, end = np.searchsorted(self._keys, [code * size, (code + 1) * size])
+        return self._keys[start:end] - code * size, self._counts[start:end]
+
+    def frequencies(self, selected_user, stop_words=frozenset()):
+        """
+        Word frequencies of the selected user without stop words.
+
+        Parameters:
+            selected_user (str): A user name, or 'Overall'.
+            stop_words (frozenset): Words to leave out.
+
+        Returns:
+            dict: Word to count.
+        """
+        token_ids, counts = self.term_counts(selected_user)
+        words = self.vocabulary[token_ids]
+        return {word: int(count) for word, count in zip(words, counts) if word not in stop_words}
+
+    def top_words(self, selected_user, k=20, stop_words=frozenset()):
+        """
+        The ``k`` most frequent words of the selected user.
+
+        Parameters:
+            selected_user (str): A user name, or 'Overall'.
+            k (int): Number of words to return.
+            stop_words (frozenset): Words to leave out.
+
+        Returns:
+            list: ``(word, count)`` pairs, most frequent first; ties in alphabetical order.
+        """
+        token_ids, counts = self.term_counts(selected_user)
+        words = self.vocabulary[token_ids]
+        candidates = ((-count, word) for count, word in zip(counts, words) if word not in stop_words)
+        return [(word, -count) for count, word in heapq.nsmallest(k, candidates)]
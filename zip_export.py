@@ -0,0 +1,177 @@
+import codecs
+import io
+import os
+import re
+import zipfile
+
+import pandas as pd
+
+from aggregates import MEDIA_TYPES
+from export_formats import EXPORT_FORMATS
+
+ZIP_MAGIC = b'PK\x03\x04'
+CHAT_MEMBER = '_chat.txt'
+CHAT_PREFIX = 'WhatsApp Chat'
+# Leading bytes of a text member read to tell the chat from text documents attached to it.
+CHAT_SNIFF_BYTES = 4096
+
+# File extensions of the attachments WhatsApp writes; anything else counts as a document.
+MEDIA_EXTENSIONS = {
+    'Images': {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic', '.bmp'},
+    'Videos': {'.mp4', '.mov', '.3gp', '.avi', '.mkv', '.webm'},
+    'Audio': {'.opus', '.ogg', '.m4a', '.mp3', '.aac', '.amr', '.wav'},
+}
+# iOS writes "<attached: 00000012-PHOTO-2021-01-01-12-00-00.jpg>", Android "IMG-20210101-WA0001.jpg (file attached)".
+# The parser splits messages on ': ', so the iOS colon is gone from parsed text.
+ATTACHMENT_PATTERN = re.compile(r'<attached:? ([^>\n]+)>|([^\n]+?) \(file attached\)')
+ATTACHMENT_MARKERS = ('<attached', ' (file attached)')
+
+
+def is_zip(source):
+    """
+    Tell whether an upload is a ZIP archive rather than a chat text.
+
+    Parameters:
+        source (str | os.PathLike | bytes | file-like): The upload.
+
+    Returns:
+        bool: True when it starts with the ZIP local file header signature.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            head = f.read(len(ZIP_MAGIC))
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        head = bytes(source[:len(ZIP_MAGIC)])
+    else:
+        source.seek(0)
+        head = source.read(len(ZIP_MAGIC))
+        source.seek(0)
+    return head == ZIP_MAGIC
+
+
+def chat_member(archive):
+    """
+    Find the chat text inside an export archive.
+
+    Parameters:
+        archive (zipfile.ZipFile): The export.
+
+    Returns:
+        str: Name of ``_chat.txt`` (iOS), or of the Android chat file (named after the chat, next to
+        the attachments): the ``.txt`` member that starts with a message timestamp, preferring names
+        starting with ``WhatsApp Chat`` and then the top-level ones.
+
+    Raises:
+        ValueError: If the archive holds no chat text.
+    """
+    texts = [info.filename for info in archive.infolist()
+             if not info.is_dir() and info.filename.lower().endswith('.txt')]
+    for name in texts:
+        if os.path.basename(name) == CHAT_MEMBER:
+            return name
+    if not texts:
+        raise ValueError('The archive contains no chat text (.txt) file.')
+    # Documents sent in the chat may be text files too, so the content decides first.
+    return min(texts, key=lambda name: (not _starts_with_message(archive, name),
+                                        not os.path.basename(name).startswith(CHAT_PREFIX),
+                                        name.count('/'), name))
+
+
+def _starts_with_message(archive, name):
+    # Only the first bytes of the member are decompressed.
+    with archive.open(name) as f:
+        head = f.read(CHAT_SNIFF_BYTES)
+    lines = head.removeprefix(codecs.BOM_UTF8).lstrip().splitlines()[:5]
+    return any(export_format.pattern.match(line) for export_format in EXPORT_FORMATS for line in lines)
+
+
+def media_type(name):
+    """
+    Classify an attachment by its file extension.
+
+    Parameters:
+        name (str): File name.
+
+    Returns:
+        str: A key of ``aggregates.MEDIA_TYPES``.
+    """
+    extension = os.path.splitext(name)[1].lower()
+    for kind, extensions in MEDIA_EXTENSIONS.items():
+        if extension in extensions:
+            return kind
+    return 'Documents'
+
+
+def media_inventory(archive, chat_name=None):
+    """
+    List the attachments of an export from the archive's central directory.
+
+    Nothing is decompressed: names and uncompressed sizes are read from the directory entries.
+
+    Parameters:
+        archive (zipfile.ZipFile): The export.
+        chat_name (str | None): Member holding the chat text, left out of the list; found with
+            ``chat_member`` if omitted.
+
+    Returns:
+        pandas.DataFrame: ``file`` (base name), ``Media Type`` and ``bytes``, one row per attachment.
+    """
+    chat_name = chat_name or chat_member(archive)
+    files = [info for info in archive.infolist() if not info.is_dir() and info.filename != chat_name]
+    names = [os.path.basename(info.filename) for info in files]
+    return pd.DataFrame({'file': names, 'Media Type': [media_type(name) for name in names],
+                         'bytes': pd.Series([info.file_size for info in files], dtype='int64')})
+
+
+def read_export(source):
+    """
+    Read the chat text and the attachment list of a "with media" export.
+
+    Only the chat member is decompressed; the media files are never read.
+
+    Parameters:
+        source (str | os.PathLike | bytes | file-like): The ZIP archive; file-likes must be seekable.
+
+    Returns:
+        tuple: The raw chat export (bytes), ready for the parser, and the ``media_inventory``.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    with zipfile.ZipFile(source) as archive:
+        name = chat_member(archive)
+        return archive.read(name), media_inventory(archive, name)
+
+
+def attached_files(messages):
+    """
+    Names of the files the messages attach.
+
+    Parameters:
+        messages (iterable): Message texts.
+
+    Returns:
+        list: Base names of the attached files, in message order.
+    """
+    # iOS puts an invisible left-to-right mark in front of attachment lines.
+    return [os.path.basename((ios or android).strip().lstrip('\u200e'))
+            for message in messages if any(marker in message for marker in ATTACHMENT_MARKERS)
+            for ios, android in ATTACHMENT_PATTERN.findall(message)]
+
+
+def attachment_summary(inventory, files=None):
+    """
+    Number and total size of the attachments of each media type.
+
+    Parameters:
+        inventory (pandas.DataFrame): The ``media_inventory`` of an export.
+        files (list | None): Only count these file names; every attachment if omitted.
+
+    Returns:
+        pandas.DataFrame: ``Media Type``, ``Files`` and ``Bytes``, in ``MEDIA_TYPES`` order.
+    """
+    if files is not None:
+        inventory = inventory[inventory['file'].isin(files)]
+    grouped = inventory.groupby('Media Type')['bytes']
+    return pd.DataFrame({'Media Type': list(MEDIA_TYPES),
+                         'Files': grouped.size().reindex(list(MEDIA_TYPES), fill_value=0).to_numpy(),
+                         'Bytes': grouped.sum().reindex(list(MEDIA_TYPES), fill_value=0).to_numpy()})